@@ -3,7 +3,6 @@
 # Global imports
 
 import sys
-import subprocess
 from PySide2 import QtCore, QtGui
 from PySide2.QtWidgets import QApplication, QMainWindow
 from PySide2.QtGui import QTextCursor
@@ -21,44 +20,48 @@ MODE_REPL = 2
 
 
 # -----------------------------------------------------------------------------
-def putty(port) -> tuple:
+def start_process(command_list: list, parent=None) -> QtCore.QProcess:
+    """Start an external program, without blocking the Qt event loop.
+
+    :param command_list: The program to run, followed by its arguments
+    :param parent: Parent QObject of the process
+    :returns: The started QProcess. Use its signals to get the output and to detect its termination.
+    """
+
+    debug(f"Calling {' '.join(command_list)}")
+    proc = QtCore.QProcess(parent)
+    proc.start(command_list[0], command_list[1:])
+    return proc
+
+
+# -----------------------------------------------------------------------------
+def putty(port, parent=None) -> QtCore.QProcess:
     """Run putty.exe with the given arguments
 
     :param port: Com port to use (string)
-    :returns: tuple of stdout and stderr text
+    :param parent: Parent QObject of the process
+    :returns: The started QProcess
     """
 
     command_list = ["putty", "-serial", port, "-sercfg", "115200,8,n,1,N"]
-    debug(f"Calling {' '.join(command_list)}")
-
-    proc = subprocess.Popen(
-        command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
-    out, err = proc.communicate(input=b"\r\n")
-    return out.decode(), err.decode()
+    return start_process(command_list, parent)
 
 
 # -----------------------------------------------------------------------------
-def miniterm(port) -> tuple:
-    """Run putty.exe with the given arguments
+def miniterm(port, parent=None) -> QtCore.QProcess:
+    """Run pyserial-miniterm.exe with the given arguments
 
     :param port: Com port to use (string)
-    :returns: tuple of stdout and stderr text
+    :param parent: Parent QObject of the process
+    :returns: The started QProcess
 
     20210218, HenkA: Does not work yet, does not react on CTRL+C or CTRL+D
     """
 
     command_list = ["pyserial-miniterm.exe", port, "115200"]
-    debug(f"Calling {' '.join(command_list)}")
-
-    # subprocess.run(command_list, shell=True)
-    # return "", ""
-
-    proc = subprocess.Popen(
-        command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
-    out, err = proc.communicate(input=b"\r\n")
-    return out.decode(), err.decode()
+    proc = start_process(command_list, parent)
+    proc.write(b"\r\n")
+    return proc
 
 
 # -----------------------------------------------------------------------------
@@ -136,13 +139,9 @@ class MainWindow(QMainWindow):
         # debug(f"Append text \"{text=}\"")
         cur = self.ui.text_output.textCursor()
         cur.movePosition(QtGui.QTextCursor.End)  # Move cursor to end of text
-        s = str(text)
-        while s:
-            head, sep, s = s.partition("\n")  # Split line at LF
-            head = head.replace("\r", "")     # Remove the Carriage Returns to avoid double linespacing.
-            cur.insertText(head)  # Insert text at cursor
-            if sep:  # New line if LF
-                cur.insertBlock()
+        # Remove the Carriage Returns to avoid double linespacing, and insert
+        # the text in one go. insertText() creates a new block for every LF.
+        cur.insertText(str(text).replace("\r", ""))
         self.ui.text_output.setTextCursor(cur)  # Update visible cursor
 
     @staticmethod
@@ -233,12 +232,10 @@ class MainWindow(QMainWindow):
                 self.ui.Repl.textbox.moveCursor(QTextCursor.End, QTextCursor.MoveAnchor)
             elif method == PUTTY:
                 self.mode = MODE_REPL
-                putty("COM4:")
-                self.show_text("Putty has been terminated\n")
+                self.show_process_output(putty("COM4:", self), "Putty")
             elif method == MINITERM:
                 self.mode = MODE_REPL
-                miniterm("COM4")
-                self.show_text("Miniterm has been terminated\n")
+                self.show_process_output(miniterm("COM4", self), "Miniterm")
             else:
                 print(f"Unknown repl {method=}")
                 self.mode = MODE_COMMAND
@@ -246,6 +243,23 @@ class MainWindow(QMainWindow):
         else:
             debug(f"ERROR, unknown mode {new_mode}")
 
+    # -------------------------------------------------------------------------
+    def show_process_output(self, proc, name):
+        """Show the output of an external process, and report when it has been terminated.
+
+        :param proc: The started QProcess
+        :param name: Name of the program, used in the termination message
+        :return: Nothing
+        """
+
+        proc.readyReadStandardOutput.connect(
+            lambda: self.append_text(bytes(proc.readAllStandardOutput()).decode())
+        )
+        proc.readyReadStandardError.connect(
+            lambda: self.append_text(bytes(proc.readAllStandardError()).decode())
+        )
+        proc.finished.connect(lambda: self.show_text(f"{name} has been terminated\n"))
+
     # -------------------------------------------------------------------------
     @dumpFuncname
     def get_ui_properties(self):
@@ -26,10 +26,14 @@
 ##
 
 import argparse
+import atexit
+import hashlib
 import io
+import json
 import logging
 import os
 import platform
+import shlex
 import sys
 import tempfile
 import pathlib
@@ -49,7 +53,6 @@ from cmd2 import (
 from cmd2 import with_argparser
 import colorama
 import serial  # type: ignore
-import keyboard
 
 # Local imports
 import param  # type: ignore
@@ -63,14 +66,36 @@ import param  # type: ignore
 
 # from mp.tokenizer import Tokenizer
 import esp32common  # type: ignore
-from lib.helper import debug, dumpArgs, debug_indent, debug_unindent
-import webrepl  # type: ignore
-import esp32flash # type: ignore
+from lib.helper import debug, debug_indent, debug_unindent
+
+# Note: webrepl (selenium) and esp32flash are only imported
+# by the commands which need them, to keep the startup of the CLI fast.
 
 from local_mpremote import main as mpremote
+from local_mpremote import pyboard as mpremote_pyboard
+
+# The output of a remote directory listing or file is reused for this number
+# of seconds, as long as no other command was sent to the device in the meantime.
+REMOTE_CACHE_TTL = 2.0
+REMOTE_CACHE_COMMANDS = ("ls", "cat")  # Commands which do not change the device
+_remote_cache: dict = {}  # (port, command and arguments) -> (time, output)
+
+# Script with cmd2 commands, which is executed at the start of the command loop
+STARTUP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".esp32clirc")
+
+# File in which cmd2 keeps the command history
+HISTORY_FILE = "cmd2_history.dat"
 
-config = mpremote.load_user_config()
-mpremote.prepare_command_expansions(config)
+# File next to esp32cli.ini, in which the hashes of the files which were
+# synced to the device are stored, per source folder. It is not kept in the
+# source folder itself, so it is not listed, synced or put under version control.
+SYNC_MANIFEST = "esp32sync.json"
+
+# Largest number of bytes per transfer step of put, get and cat
+MAX_TRANSFER_BUFFER_SIZE = 65536
+
+# Number of bytes read at a time when hashing a file
+HASH_BLOCKSIZE = 1024 * 1024
 
 
 # -----------------------------------------------------------------------------
@@ -91,6 +116,85 @@ def must_have_port(method):
     return _impl
 
 
+# -----------------------------------------------------------------------------
+def run_remote(*args):
+    """Run a mpremote command on the connected device.
+
+    The serial connection is kept open after the command, so the next command
+    does not have to open the port and enter the raw REPL again.
+
+    :param args: mpremote command and its arguments, e.g. "exec", "print(1)"
+    :returns: The output of the command
+    """
+
+    # Without a port mpremote would exit the program, so report it here.
+    # This one check covers every command which talks to the device, so the
+    # do_ methods do not need a decorator for it.
+    if not param.port_str:
+        print("ERROR: No port defined")
+        return b""
+
+    # Any other command may change the filesystem on the device
+    if args and args[0] not in REMOTE_CACHE_COMMANDS:
+        _remote_cache.clear()
+    try:
+        return mpremote.main(["connect", param.port_str, *args], persistent=True)
+    except SystemExit:
+        # mpremote already printed the reason, and dropped the connection
+        return b""
+    except (mpremote.pyboard.PyboardError, OSError) as er:
+        print(f"ERROR: {er}")
+        return b""
+
+
+# -----------------------------------------------------------------------------
+def run_remote_cached(*args) -> bytes:
+    """Run a mpremote command which only reads from the device.
+
+    The output of the last few seconds is reused, if no other command was
+    sent to the device in the meantime.
+
+    :param args: mpremote command and its arguments, e.g. "cat", "main.py"
+    :returns: The output of the command
+    """
+
+    now = time.monotonic()
+    key = (param.port_str, args)
+    cached = _remote_cache.get(key)
+    if cached and now - cached[0] < REMOTE_CACHE_TTL:
+        print(cached[1].decode("utf-8", errors="replace"), end="")
+        return cached[1]
+
+    output = run_remote(*args)
+    if output:
+        # Drop the outdated entries, so large files are not kept around
+        outdated = [
+            k for k, (t, _) in _remote_cache.items() if now - t >= REMOTE_CACHE_TTL
+        ]
+        for k in outdated:
+            del _remote_cache[k]
+        _remote_cache[key] = (time.monotonic(), output)
+    return output
+
+
+# -----------------------------------------------------------------------------
+def close_remote() -> None:
+    """Close the serial connection which was kept open by run_remote()."""
+
+    mpremote.close_connection()
+
+
+# -----------------------------------------------------------------------------
+def release_remote() -> None:
+    """Free the serial port for another program, like esptool or putty.
+
+    The connection itself is kept, and the port is opened again by the
+    next run_remote().
+    """
+
+    mpremote.release_connection()
+
+
 # -----------------------------------------------------------------------------
 def available_binfiles(folder) -> list:
     """Get a list of available micropython bin files.
@@ -107,6 +211,22 @@ def available_binfiles(folder) -> list:
     return list(available_files)
 
 
+# -----------------------------------------------------------------------------
+def local_path(filename) -> str:
+    """Determine the path of a file on the PC.
+
+    This uses os.path instead of pathlib, as it is called for every
+    transferred file and the result is only passed on as a string.
+
+    :param filename: Absolute path, or a path relative to the current source folder
+    :returns: Absolute path of the file
+    """
+
+    if os.path.isabs(filename):
+        return os.fspath(filename)
+    return os.path.join(esp32common.get_sourcefolder(), filename)
+
+
 # -----------------------------------------------------------------------------
 def put(local_filename, remote_filename=""):
     """Copy the given local file to the connected device.
@@ -118,44 +238,233 @@ def put(local_filename, remote_filename=""):
     be used.
     """
 
-    if not pathlib.Path(local_filename).is_absolute():
-        sourcefolder = esp32common.get_sourcefolder()
-        local_filename = str(sourcefolder / local_filename)
+    localfile = local_path(local_filename)
 
     if not remote_filename:
         # If no destination filename was given, use the same name as the source, but only the basic filename.
         # This also implies it will be written to the root.
-        remote_filename = pathlib.Path(local_filename).name
+        remote_filename = os.path.basename(localfile)
 
-    ret = mpremote.main(
-        ["connect", param.port_str, "cp", local_filename, ":" + remote_filename]
-    )
+    ret = run_remote("cp", localfile, ":" + remote_filename)
     return ret
 
 
+# -----------------------------------------------------------------------------
+def put_many(local_filenames) -> list:
+    """Copy the given local files to the root of the connected device.
+
+    All files are copied with one mpremote command, so the device is only
+    prepared for the transfer once, instead of once for every file.
+    mpremote stops at the first file which can not be copied.
+
+    :param local_filenames: List of files on the PC
+    :returns: The local filenames which were actually copied
+    """
+
+    mpremote_pyboard.reset_last_copied()
+    if not local_filenames:
+        return []
+
+    # mpremote determines the destination name by splitting at "/"
+    sources = {pathlib.Path(filename).as_posix(): filename for filename in local_filenames}
+    run_remote("cp", *sources, ":")
+    return [sources[src] for src in mpremote_pyboard.get_last_copied() if src in sources]
+
+
+# -----------------------------------------------------------------------------
+def file_hash(filename) -> str:
+    """Determine the hash of the contents of the given file.
+
+    The file is hashed in blocks, so a large file is not read into memory
+    at once.
+
+    :param filename: File on the PC
+    :returns: Hexadecimal hash string
+    """
+
+    with open(filename, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11 and later
+            return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+        h = hashlib.blake2b(digest_size=16)
+        for block in iter(lambda: f.read(HASH_BLOCKSIZE), b""):
+            h.update(block)
+        return h.hexdigest()
+
+
+# -----------------------------------------------------------------------------
+def _read_sync_manifests() -> dict:
+    """Read the hashes of the synced files of all source folders.
+
+    :returns: dict with per source folder a dict with per port a dict of filename and hash
+    """
+
+    try:
+        with open(SYNC_MANIFEST, "r") as f:
+            manifests = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifests if isinstance(manifests, dict) else {}
+
+
+# -----------------------------------------------------------------------------
+def load_sync_manifest(folder) -> dict:
+    """Load the hashes of the files which were synced from the given folder.
+
+    :param folder: Source folder
+    :returns: dict with per port a dict of filename and hash
+    """
+
+    manifest = _read_sync_manifests().get(str(pathlib.Path(folder).resolve()))
+    return manifest if isinstance(manifest, dict) else {}
+
+
+# -----------------------------------------------------------------------------
+def save_sync_manifest(folder, manifest) -> None:
+    """Save the hashes of the files which were synced from the given folder.
+
+    The hashes of the other source folders in SYNC_MANIFEST are kept.
+
+    :param folder: Source folder
+    :param manifest: dict with per port a dict of filename and hash
+    """
+
+    manifests = _read_sync_manifests()
+    manifests[str(pathlib.Path(folder).resolve())] = manifest
+    _write_sync_manifests(manifests)
+
+
+# -----------------------------------------------------------------------------
+def _write_sync_manifests(manifests) -> None:
+    """Write the hashes of the synced files of all source folders.
+
+    The manifest is written to a temporary file first, and then renamed,
+    so an interrupted write never leaves a damaged manifest behind.
+
+    :param manifests: dict with per source folder a dict with per port a dict of filename and hash
+    """
+
+    temp_file = SYNC_MANIFEST + ".tmp"
+    try:
+        with open(temp_file, "w") as f:
+            json.dump(manifests, f, indent=2, sort_keys=True)
+        os.replace(temp_file, SYNC_MANIFEST)
+    except OSError as e:
+        print(f"Could not save {SYNC_MANIFEST}: {e}")
+
+
+# -----------------------------------------------------------------------------
+def forget_synced_files(port, remote_filename=None) -> None:
+    """Forget that files were synced to the device, so the next sync copies them again.
+
+    :param port: Port of the device
+    :param remote_filename: File which was removed from the device, None for all files
+    """
+
+    name = None
+    if remote_filename is not None:
+        # Only the root folder of the device is synced
+        name = remote_filename.lstrip("/")
+        if "/" in name:
+            return
+
+    manifests = _read_sync_manifests()
+    changed = False
+    for manifest in manifests.values():
+        synced = manifest.get(port) if isinstance(manifest, dict) else None
+        if not synced:
+            continue
+        if name is None:
+            del manifest[port]
+            changed = True
+        elif name in synced:
+            del synced[name]
+            changed = True
+    if changed:
+        _write_sync_manifests(manifests)
+
+
+# -----------------------------------------------------------------------------
+def _changed_files(folder, synced, force=False) -> dict:
+    """Determine which files in the source folder have to be synced.
+
+    :param folder: Source folder
+    :param synced: dict of filename and hash of the files synced to this port
+    :param force: If True, also return the files which did not change
+    :returns: dict with per path of a file to copy, its name and hash
+    """
+
+    files = {}
+    # os.scandir() returns DirEntry objects, which already know if they
+    # are a file, so no extra stat() call per entry is needed.
+    with os.scandir(folder) as entries:
+        entries = sorted(entries, key=lambda e: e.name)
+    for entry in entries:
+        if not entry.is_file():
+            print(f"cannot sync subolder {entry.path} (yet)")
+            continue
+        digest = file_hash(entry.path)
+        if not force and synced.get(entry.name) == digest:
+            print(f" -  {entry.path} (unchanged)")
+            continue
+        print(f" *  {entry.path}")
+        files[entry.path] = (entry.name, digest)
+    return files
+
+
+# -----------------------------------------------------------------------------
+def _update_manifest(folder, manifest, synced, files, copied) -> None:
+    """Record the hashes of the files which were synced.
+
+    Only the files which were actually copied are recorded, so the others
+    are retried by the next sync.
+
+    :param folder: Source folder
+    :param manifest: dict with per port a dict of filename and hash
+    :param synced: The dict of the current port in the manifest
+    :param files: dict with per path of the files to copy, its name and hash
+    :param copied: Paths of the files which were copied
+    """
+
+    for path in copied:
+        name, digest = files[path]
+        synced[name] = digest
+    for path in files:
+        if path not in copied:
+            print(f"Could not copy {path}")
+    if copied:
+        save_sync_manifest(folder, manifest)
+
+
 # -----------------------------------------------------------------------------
 def get(remote_filename, local_filename=""):
     """Get file from device to local PC."""
 
-    if local_filename:
-        localfile = local_filename
-        # If this is not an absolute path, then make sure the file is stored
-        # in the current sourecefolder.
-        if not pathlib.Path(localfile).is_absolute():
-            sourcefolder = esp32common.get_sourcefolder()
-            localfile = str(sourcefolder / localfile)
-    else:
-        # If no PC filename was given, use the same name as the remote file,
-        # and make sure the file will be stored in the current source folder.
-        sourcefolder = esp32common.get_sourcefolder()
-        localfile = str(sourcefolder / remote_filename)
+    # If no PC filename was given, use the same name as the remote file.
+    # A relative name is stored in the current source folder.
+    localfile = local_path(local_filename or remote_filename)
 
-    ret = mpremote.main(
-        ["connect", param.port_str, "cp", ":" + remote_filename, localfile]
-    )
+    ret = run_remote("cp", ":" + remote_filename, localfile)
     return ret
 
 
+# -----------------------------------------------------------------------------
+def import_remote(filename) -> bytes:
+    """Run a python file on the connected device, by importing it there.
+
+    The kept connection is not soft reset between the commands, so the module
+    is removed from sys.modules first. Otherwise a second import would not run
+    the (possibly changed) file again.
+
+    :param filename: Name of the file on the device, with or without ".py"
+    :returns: The output of the import
+    """
+
+    modulename = filename[:-3] if filename.endswith(".py") else filename
+    return run_remote(
+        "exec", f"import sys; sys.modules.pop('{modulename}', None); import {modulename}"
+    )
+
+
 # -----------------------------------------------------------------------------
 def repl(reboot=False, ctrlc=False) -> None:
     """Start the Micropython REPL.
@@ -164,35 +473,36 @@ def repl(reboot=False, ctrlc=False) -> None:
     :param ctrlc: Interrupt the running program with CTRL+C
     """
 
-    def do_reboot():
-        """Press CTRL+D twice.
-        """
-        debug("Sending CTRL+D twice")
-        keyboard.press_and_release("ctrl+d")
-        time.sleep(0.1)
-        keyboard.press_and_release("ctrl+d")
-        time.sleep(0.1)
-
-    def do_ctrlc():
-        """Press CTRL+D and then CTRL+C twice.
-        """
-        debug("Sending CTRL+D and then CTRL+C twice")
-        keyboard.press_and_release("ctrl+d")  # First soft reboot
-        time.sleep(0.1)
-        keyboard.press_and_release("ctrl+c")  # Then interrupt the boot process
-        time.sleep(0.1)
-        keyboard.press_and_release("ctrl+c")  # Twice
-        time.sleep(0.1)
-
-    # If required, perform a soft reboot of the connected device by sending CTRL+D
-    if reboot:
-        keyboard.call_later(do_reboot, args=(), delay=0.2)
+    # The REPL uses its own connection, so release the one kept by run_remote()
+    close_remote()
 
-    # If required, interrupt the running program with CTRL+C
-    if ctrlc:
-        keyboard.call_later(do_ctrlc, args=(), delay=0.2)
+    try:
+        if not (reboot or ctrlc):
+            mpremote.main(["connect", param.port_str, "repl"])
+            return
 
-    mpremote.main(["connect", param.port_str, "repl"])
+        pyb = mpremote.do_connect([param.port_str])
+        try:
+            # The control characters are written to the device itself. The
+            # REPL shows the response of the device as soon as it is started.
+            if reboot:
+                debug("Sending CTRL+D")
+                pyb.serial.write(b"\x04")
+            if ctrlc:
+                debug("Sending CTRL+D and then CTRL+C twice")
+                pyb.serial.write(b"\x04")  # First soft reboot
+                time.sleep(0.1)
+                pyb.serial.write(b"\x03")  # Then interrupt the boot process
+                time.sleep(0.1)
+                pyb.serial.write(b"\x03")  # Twice
+            mpremote.do_repl(pyb, [])
+        finally:
+            mpremote.do_disconnect(pyb)
+    except SystemExit:
+        pass  # mpremote already printed the reason
+    except (mpremote.pyboard.PyboardError, OSError) as er:
+        # For example a port which is in use by another program, or unplugged
+        print(f"ERROR: {er}")
 
 
 # -------------------------------------------------------------------------
@@ -205,7 +515,9 @@ def softreset() -> None:
     """
 
     command = textwrap.dedent(command)
-    ret = mpremote.main(["connect", param.port_str, "exec", command])
+    ret = run_remote("exec", command)
+    # The device restarts, so the open connection can not be used anymore
+    close_remote()
     print(ret)
 
 
@@ -223,7 +535,7 @@ def get_ip() -> str:
     """
 
     command = textwrap.dedent(command)
-    ret = mpremote.main(["connect", param.port_str, "exec", command])
+    ret = run_remote("exec", command)
     debug(f"{ret=}")
     return ret.strip()
 
@@ -248,11 +560,7 @@ def get_ip() -> str:
 #
 #     if param.is_gui:
 #         param.worker.run_command(cmdstr)
-#         while param.worker.active:
-#             # The following 3 lines will do the same as time.sleep(1), but more PyQt5 friendly.
-#             loop = QEventLoop()
-#             QTimer.singleShot(250, loop.quit)
-#             loop.exec_()
+#         param.worker.wait()  # Idle till the worker signals it has finished
 #         return True
 #
 #     # If we are here, then this was not the gui version, and have to run
@@ -275,28 +583,40 @@ class ESPShell(cmd2.Cmd):
     CMD_CAT_RUN = "Execution commands"
     CMD_CAT_REPL = "REPL related functions"
 
+    # Names of the foreground colors, determined once for all instances
+    FG_BY_NAME = {c.name.lower(): c for c in Fg}
+    FG_COLORS = tuple(FG_BY_NAME)
+
     def __init__(
-        self, color=False, caching=False, reset=False, autoconnect=True, port=""
+        self,
+        color=False,
+        caching=False,
+        reset=False,
+        autoconnect=True,
+        port="",
+        use_startup_script=True,
     ):
-        """Initialialize class ESPShell instance."""
+        """Initialialize class ESPShell instance.
 
-        startup_script = os.path.join(os.path.dirname(__file__), ".esp32clirc")
-        super().__init__(
-            multiline_commands=["echo"],
-            startup_script=startup_script,
-            persistent_history_file="cmd2_history.dat",
-        )
+        The startup script is only executed by cmdloop(), so it is not needed
+        when only single commands are executed.
+        """
 
+        startup_script = ""
+        if use_startup_script and os.path.isfile(STARTUP_SCRIPT):
+            startup_script = STARTUP_SCRIPT
+        stdout = None
         if color:
             colorama.init()
-            cmd2.Cmd.__init__(
-                self,
-                stdout=colorama.initialise.wrapped_stdout,
-                startup_script=startup_script,
-                persistent_history_file="cmd2_history.dat",
-            )
-        else:
-            cmd2.Cmd.__init__(self)
+            stdout = colorama.initialise.wrapped_stdout
+
+        # cmd2 is initialized once, as it loads the history file and
+        # registers all its commands and settings
+        super().__init__(
+            stdout=stdout,
+            startup_script=startup_script,
+            persistent_history_file=HISTORY_FILE,
+        )
 
         if platform.system() == "Windows":
             self.use_rawinput = False
@@ -316,9 +636,6 @@ class ESPShell(cmd2.Cmd):
         self.__intro()
         self.__set_prompt_path()
 
-        # Used as prompt for multiline commands after the first line
-        self.continuation_prompt = "... "
-
         # Allow access to your application in py and ipy via self
         self.self_in_py = True
 
@@ -328,22 +645,98 @@ class ESPShell(cmd2.Cmd):
         # Color to output text in with echo command
         self.foreground_color = "yellow"
 
-        # # Make echo_fg settable at runtime
-        # self.add_settable(
-        #     cmd2.Settable(
-        #         "foreground_color",
-        #         str,
-        #         "Foreground color to use with echo command",
-        #         self,
-        #         choices=fg.colors(),
-        #     )
-        # )
+        # Make the size of the file transfer steps settable at runtime
+        self.add_settable(
+            cmd2.Settable(
+                "transfer_buffer_size",
+                self._transfer_buffer_size,
+                f"Number of bytes per transfer step of put, get and cat (1..{MAX_TRANSFER_BUFFER_SIZE})",
+                param,
+                onchange_cb=self._onchange_transfer_buffer_size,
+            )
+        )
+        mpremote_pyboard.transfer_chunk_size = param.transfer_buffer_size
+
+        # Make the serial settings settable at runtime. The defaults are read
+        # from the [com] section of esp32cli.ini, so they also apply to
+        # "esp32cli -c ... -n", which does not run the .esp32clirc startup script.
+        param.baudrate = esp32common.get_baudrate(param.config)
+        param.rtscts = esp32common.get_rtscts(param.config)
+        self.add_settable(
+            cmd2.Settable(
+                "baudrate",
+                int,
+                "Baudrate of the serial connection, must match the device (default: [com] baudrate in esp32cli.ini)",
+                param,
+                onchange_cb=self._onchange_serial_settings,
+            )
+        )
+        self.add_settable(
+            cmd2.Settable(
+                "rtscts",
+                bool,
+                "Use RTS/CTS hardware flow control on the serial connection (default: [com] rtscts in esp32cli.ini)",
+                param,
+                onchange_cb=self._onchange_serial_settings,
+            )
+        )
+        mpremote.baudrate = param.baudrate
+        mpremote.rtscts = param.rtscts
+
+        # Make echo_fg settable at runtime
+        self.add_settable(
+            cmd2.Settable(
+                "foreground_color",
+                str,
+                "Foreground color to use with echo command",
+                self,
+                choices=self.FG_COLORS,
+            )
+        )
 
         # if self.port and autoconnect:
         #     debug(f"Automatic trying to use {port=}")
         #     ret = self.__connect(f"ser:{self.port}")
         #     print(f"{ret=}")
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _transfer_buffer_size(value) -> int:
+        """Convert and check a new value of the transfer_buffer_size setting.
+
+        :param value: The value given with "set transfer_buffer_size"
+        :returns: The size as an integer
+        :raises ValueError: If the size is out of range. cmd2 then reports
+            the error, and keeps the old value.
+        """
+
+        size = int(value)
+        if not 1 <= size <= MAX_TRANSFER_BUFFER_SIZE:
+            raise ValueError(
+                f"transfer_buffer_size must be between 1 and {MAX_TRANSFER_BUFFER_SIZE}"
+            )
+        return size
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _onchange_transfer_buffer_size(_param_name, _old_value, new_value) -> None:
+        """Pass a changed transfer_buffer_size on to mpremote."""
+
+        mpremote_pyboard.transfer_chunk_size = new_value
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _onchange_serial_settings(_param_name, _old_value, _new_value) -> None:
+        """Use changed serial settings for the next connection to the device.
+
+        If the device does not respond anymore, set the baudrate back to
+        115200, which is the default baudrate of the MicroPython REPL.
+        """
+
+        mpremote.baudrate = param.baudrate
+        mpremote.rtscts = param.rtscts
+        close_remote()  # The open connection still uses the old settings
+
     # -------------------------------------------------------------------------
     def __intro(self) -> None:
         """Show the cmd intro."""
@@ -401,13 +794,44 @@ class ESPShell(cmd2.Cmd):
         else:
             print("\n" + msg + "\n")
 
+    # -------------------------------------------------------------------------
+    def onecmd_fast(self, line: str) -> None:
+        """Execute a single command, without the cmd2 parsing and hooks.
+
+        This is meant for the commands given on the commandline, where no
+        history is needed. Pipes and redirection are passed on to
+        onecmd_plus_hooks(), which implements them. Anything else this can
+        not handle, like shortcuts, aliases and macros, is passed on to
+        onecmd().
+
+        :param line: The command line to execute
+        """
+
+        name, _, args = line.partition(" ")
+        if any(c in args for c in "|<>"):
+            self.onecmd_plus_hooks(line)
+            return
+
+        func = self.cmd_func(name)
+        if func is None:
+            self.onecmd(line)
+            return
+
+        # Quotes are kept, like cmd2 does. This also keeps the backslashes in
+        # Windows paths.
+        args = args.strip()
+        statement = cmd2.Statement(
+            args, raw=line, command=name, arg_list=shlex.split(args, posix=False)
+        )
+        func(statement)
+
     # -------------------------------------------------------------------------
     @staticmethod
     def do_version(_args) -> None:
         """Print the micropython version, running on the connected device."""
 
         command = "print(uos.uname().release)"
-        ret = mpremote.main(["connect", param.port_str, "exec", command])
+        ret = run_remote("exec", command)
         version = ret.decode("utf-8")
         print(f"Micropython version {version}")
 
@@ -419,17 +843,61 @@ class ESPShell(cmd2.Cmd):
 
     do_EOF = do_exit
 
+    # -------------------------------------------------------------------------
+    open_parser = argparse.ArgumentParser()
+    open_parser.add_argument(
+        "port", nargs="?", default="", help="Serial port, like COM5 or /dev/ttyUSB0"
+    )
+
+    @with_argparser(open_parser)
+    @cmd2.with_category(CMD_CAT_CONNECTING)
+    def do_open(self, statement):
+        """open [PORT].
+
+        Open the serial connection to the device, and keep it open for the
+        following commands. Without a PORT, the current port is used.
+        """
+
+        if statement.port:
+            close_remote()
+            param.port_str = statement.port
+
+        if not param.port_str:
+            self.__error("No port defined")
+            return
+
+        try:
+            mpremote.open_connection(param.port_str)
+        except SystemExit:
+            # mpremote already printed the reason
+            self.__error(f"Could not open {param.port_str}")
+
+    # -------------------------------------------------------------------------
+    @cmd2.with_category(CMD_CAT_CONNECTING)
+    def do_close(self, _statement):
+        """Close the serial connection to the device.
+
+        This frees the serial port for other programs, like putty.
+        """
+
+        close_remote()
+
     # -------------------------------------------------------------------------
     @cmd2.with_category(CMD_CAT_FILES)
-    @dumpArgs
     def do_ls(self, statement):
-        """List remote files."""
+        """List remote files.
 
-        cmds = ["connect", param.port_str, statement.raw]
-        debug(f"do_ls() {cmds=}")
-        mpremote.main(["connect", param.port_str, statement.raw])
+        A listing of the last few seconds is reused, if no other command
+        was sent to the device in the meantime.
+        """
+
+        run_remote_cached("ls", *statement.arg_list)
 
     # -------------------------------------------------------------------------
+    md_parser = argparse.ArgumentParser()
+    md_parser.add_argument("remotedir", help="Directory on connected device")
+
+    @with_argparser(md_parser)
     @cmd2.with_category(CMD_CAT_FILES)
     def do_md(self, statement):
         """md <TARGET DIR> or mkdir <TARGET DIR>.
@@ -437,21 +905,15 @@ class ESPShell(cmd2.Cmd):
         Create new remote directory.
         """
 
-        debug(f"do_md {statement=}")
-
-        if not statement.arg_list:
-            self.__error("Missing argument: <REMOTE DIR>")
-            return
-
-        if len(statement.arg_list) != 1:
-            self.__error("Only one argument allowed: <REMOTE DIR>")
-            return
-
-        mpremote.main(["connect", param.port_str, "mkdir", statement.arg_list[0]])
+        run_remote("mkdir", statement.remotedir)
 
     do_mkdir = do_md  # Create an alisas
 
     # -------------------------------------------------------------------------
+    rd_parser = argparse.ArgumentParser()
+    rd_parser.add_argument("remotedir", help="Directory on connected device")
+
+    @with_argparser(rd_parser)
     @cmd2.with_category(CMD_CAT_FILES)
     def do_rd(self, statement):
         """rd <TARGET DIR> or rmdir <TARGET DIR>.
@@ -459,28 +921,24 @@ class ESPShell(cmd2.Cmd):
         Remove the given folder/directory
         """
 
-        debug(f"do_rd {statement=}")
-
-        if not statement.arg_list:
-            self.__error("Missing argument: <REMOTE DIR>")
-            return
-
-        if len(statement.arg_list) != 1:
-            self.__error("Only one argument allowed: <REMOTE DIR>")
-            return
-
-        mpremote.main(["connect", param.port_str, "rmdir", statement.arg_list[0]])
+        run_remote("rmdir", statement.remotedir)
 
     do_rmdir = do_rd  # Create an alisas
 
     # -------------------------------------------------------------------------
+    lls_parser = argparse.ArgumentParser()
+    lls_parser.add_argument(
+        "folder", nargs="?", default="", help="Optional local folder to list"
+    )
+
+    @with_argparser(lls_parser)
     @cmd2.with_category(CMD_CAT_FILES)
     def do_lls(self, statement):
         """List files in current local directory."""
 
         # If a foldername is given, use that. The default is the current defined source folder
-        if len(statement.arg_list) == 1:
-            folder = pathlib.Path(statement.arg_list[0])
+        if statement.folder:
+            folder = pathlib.Path(statement.folder)
         else:
             folder = esp32common.get_sourcefolder()
 
@@ -488,34 +946,38 @@ class ESPShell(cmd2.Cmd):
             print(f"Could not find local folder {folder}")
             return
 
-        # First print the directories
-        files = folder.glob("*")  # Note: this returns an iterator, not just a list.
-        print(f'\nLocal files in sourcefolder "{folder}":\n')
-        for f in files:
-            if f.is_dir():
-                if self.color:
-                    print(
-                        colorama.Fore.MAGENTA
-                        + (" <dir> %s" % str(f.name))
-                        + colorama.Fore.RESET
-                    )
-                else:
-                    print(" <dir> %s" % str(f.name))
-
-        # Then print the files
-        files = folder.glob("*")  # Note: this returns an iterator, not just a list.
-        for f in files:
-            if f.is_file():
-                if self.color:
-                    print(
-                        colorama.Fore.CYAN
-                        + ("       %s" % str(f.name))
-                        + colorama.Fore.RESET
-                    )
-                else:
-                    print("       %s" % str(f.name))
-
-        print("")
+        # Sort the names of the directories and the files, so the listing
+        # does not depend on the order in which the filesystem returns them.
+        # scandir() gets the file type with the names, so no extra stat()
+        # call is needed per entry on most platforms.
+        dirnames = []
+        filenames = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    dirnames.append(entry.name)
+                elif entry.is_file():
+                    filenames.append(entry.name)
+        dirnames.sort()
+        filenames.sort()
+
+        # Determine the color codes once, instead of for every line
+        if self.color:
+            dir_color = colorama.Fore.MAGENTA
+            file_color = colorama.Fore.CYAN
+            reset = colorama.Fore.RESET
+        else:
+            dir_color = file_color = reset = ""
+
+        # Collect the lines, and print them at once
+        lines = [f'\nLocal files in sourcefolder "{folder}":\n']
+
+        # First the directories, then the files
+        lines.extend(f"{dir_color} <dir> {name}{reset}" for name in dirnames)
+        lines.extend(f"{file_color}       {name}{reset}" for name in filenames)
+
+        lines.append("")
+        print("\n".join(lines))
 
     do_ldir = do_lls  # Create an alias
 
@@ -578,7 +1040,7 @@ class ESPShell(cmd2.Cmd):
         Else, the remote file will be named the same as the local file.
         """
 
-        debug(f"do_put {statement=}")
+        debug(f"do_put {statement.srcfile=} {statement.dstfile=}")
         put(statement.srcfile, statement.dstfile)
 
     # # -------------------------------------------------------------------------
@@ -623,7 +1085,7 @@ class ESPShell(cmd2.Cmd):
         Else, the locale file will be named the same as the remote file.
         """
 
-        debug(f"do_get() {statement=}")
+        debug(f"do_get() {statement.remotefile=} {statement.localfile=}")
         get(statement.remotefile, statement.localfile)
 
         # remotefile = statement.remotefile
@@ -686,7 +1148,8 @@ class ESPShell(cmd2.Cmd):
         Remove a remote file.
         """
 
-        mpremote.main(["connect", param.port_str, "rm", statement.filename])
+        run_remote("rm", statement.filename)
+        forget_synced_files(param.port_str, statement.filename)
 
     # # -------------------------------------------------------------------------
     # mrm_parser = argparse.ArgumentParser()
@@ -749,7 +1212,8 @@ class ESPShell(cmd2.Cmd):
         )
 
         command = textwrap.dedent(command)
-        mpremote.main(["connect", param.port_str, "exec", command])
+        run_remote("exec", command)
+        forget_synced_files(param.port_str)
 
     # -------------------------------------------------------------------------
     cat_parser = argparse.ArgumentParser()
@@ -758,9 +1222,13 @@ class ESPShell(cmd2.Cmd):
     @with_argparser(cat_parser)
     @cmd2.with_category(CMD_CAT_FILES)
     def do_cat(self, statement):
-        """Print the contents of a remote file."""
+        """Print the contents of a remote file.
+
+        The contents of the last few seconds are reused, if no other command
+        was sent to the device in the meantime.
+        """
 
-        mpremote.main(["connect", param.port_str, "cat", statement.filename])
+        run_remote_cached("cat", statement.filename)
 
     # -------------------------------------------------------------------------
     @cmd2.with_category(CMD_CAT_RUN)
@@ -776,7 +1244,7 @@ class ESPShell(cmd2.Cmd):
         """
 
         # print(f"{statement=}")
-        mpremote.main(["connect", param.port_str, "exec", statement.args])
+        run_remote("exec", statement.args)
 
     # -------------------------------------------------------------------------
     @cmd2.with_category(CMD_CAT_RUN)
@@ -794,15 +1262,15 @@ class ESPShell(cmd2.Cmd):
         """
         command = textwrap.dedent(command)
 
-        ret = mpremote.main(["connect", param.port_str, "exec", command])
+        ret = run_remote("exec", command)
         ret = ret.strip()
         if ret.startswith(b"(") and ret.endswith(b")"):
             ret = ret[1:-1]
         t = ret.split(b",")
-        print(40*'-')
-        for s in t:
-            print(s.strip().decode("utf-8"))
-        print(40 * '-')
+        # Write the whole table at once
+        separator = 40 * "-"
+        lines = [separator, *(s.strip().decode("utf-8") for s in t), separator]
+        self.poutput("\n".join(lines))
 
     # -------------------------------------------------------------------------
     @cmd2.with_category(CMD_CAT_RUN)
@@ -812,7 +1280,7 @@ class ESPShell(cmd2.Cmd):
         Simple example: eval 1+2
         """
 
-        mpremote.main(["connect", param.port_str, "eval", statement.args])
+        run_remote("eval", statement.args)
 
     # -------------------------------------------------------------------------
     execfile_parser = argparse.ArgumentParser()
@@ -823,19 +1291,9 @@ class ESPShell(cmd2.Cmd):
     def do_execfile(self, statement):
         """Execute a local python file on the remote device."""
 
-        debug(f"{statement=}")
+        debug(f"{statement.srcfile=}")
         put(statement.srcfile)
-
-        filename = statement.srcfile
-        if filename.endswith(".py"):
-            filename = filename[:-3]
-
-        command = f"""
-             import {filename}
-        """
-        command = textwrap.dedent(command)
-
-        _ret = mpremote.main(["connect", param.port_str, "exec", command])
+        import_remote(statement.srcfile)
 
     # -------------------------------------------------------------------------
     run_parser = argparse.ArgumentParser()
@@ -846,19 +1304,8 @@ class ESPShell(cmd2.Cmd):
     def do_run(self, statement):
         """Run the given local file on the connected device."""
 
-        debug(f"{statement=}")
-
-        filename = statement.srcfile
-        if filename.endswith(".py"):
-            filename = filename[:-3]
-
-        command = f"""
-             import {filename}
-             # {filename}.main()
-        """
-        command = textwrap.dedent(command)
-
-        _ret = mpremote.main(["connect", param.port_str, "exec", command])
+        debug(f"{statement.srcfile=}")
+        import_remote(statement.srcfile)
 
     do_start = do_run  # Create an alias
 
@@ -882,7 +1329,7 @@ class ESPShell(cmd2.Cmd):
     def do_repl(self, statement):
         """Enter Micropython REPL over serial connection."""
 
-        debug(f"{statement=}")
+        debug(f"{statement.reboot=} {statement.ctrlc=}")
         # self.start_repl(with_softreboot=statement.reboot, with_ctrlc=statement.ctrlc)
 
         repl(statement.reboot, statement.ctrlc)
@@ -907,35 +1354,33 @@ class ESPShell(cmd2.Cmd):
             local_filename = os.path.join(temp_dir, os.path.basename(filename))
             debug(f"Retrieving {filename=} as {local_filename=}")
             print(f"Retrieving {filename}")
-            mpremote.main(
-                ["connect", param.port_str, "cp", ":" + filename, local_filename]
-            )
+            run_remote("cp", ":" + filename, local_filename)
             if not os.path.isfile(local_filename):
                 print(f"Error: Could not find {local_filename}")
+                return
 
-            # Determine the current state, so we can see if the file has
-            # been changed later. If so, we know to write it back.
-            oldstat = os.stat(local_filename)
-
-            # Determine the editor, and edit the file in the tempoarary folder
-            # editor = pathlib.Path("C:/Program Files/Notepad++/notepad++.exe")
-            # editor = pathlib.Path(r"C:\Users\HenkA\AppData\Local\Programs\Microsoft VS Code\Code.exe")
-            editor = param.config["editor"]["exe"]
-            cmdstr = f'"{editor}" "{local_filename}"'
-            esp32common.run_program(cmdstr)
-
-            # What is the new state?
-            newstat = os.stat(local_filename)
-
-            # If the state has been changed, the file contents might be modified, and
-            # it has to be written back to the connected device.
-            if oldstat != newstat:
+            # Determine the modification time and size, so we can see if the
+            # file has been changed later. If so, we know to write it back.
+            # Note: The complete os.stat() result can not be used, as it also
+            # contains the access time, which changes when the editor reads the file.
+            old_stat = os.stat(local_filename)
+            old_hash = file_hash(local_filename)
+
+            # Edit the file in the temporary folder
+            esp32common.run_program([esp32common.get_editor(), local_filename])
+
+            # If the file has been saved, the file contents might be modified, and
+            # it has to be written back to the connected device. A file which
+            # was saved without changes has the same hash, and is not written.
+            new_stat = os.stat(local_filename)
+            if (new_stat.st_mtime_ns, new_stat.st_size) != (
+                old_stat.st_mtime_ns,
+                old_stat.st_size,
+            ) and file_hash(local_filename) != old_hash:
                 print(f"Updating {filename}")
-                mpremote.main(
-                    ["connect", param.port_str, "cp", local_filename, ":" + filename]
-                )
+                run_remote("cp", local_filename, ":" + filename)
             else:
-                debug(f"{local_filename} was not modified")
+                print(f"No changes in {filename}, skipping upload")
 
     # -------------------------------------------------------------------------
     @cmd2.with_category(CMD_CAT_EDIT)
@@ -946,24 +1391,14 @@ class ESPShell(cmd2.Cmd):
         If not, then handle the filename as part of the defined micropython source folder
         """
 
-        debug(f"edit {statement=}")
+        debug(f"edit {statement.args=}")
         filename = statement.args  # Just the raw argument string
 
         # If the given filename is not absolute, then assume it is located
         # in the current micropython sourcefolder
-        if not pathlib.Path(filename).is_absolute():
-            sourcefolder = esp32common.get_sourcefolder()
-            sourcefile = sourcefolder.joinpath(filename)
-        else:
-            sourcefile = filename
+        sourcefile = local_path(filename)
 
-        # editor = pathlib.Path("C:/Program Files/Notepad++/notepad++.exe")
-        # editor = pathlib.Path(
-        #     r"C:\Users\HenkA\AppData\Local\Programs\Microsoft VS Code\Code.exe"
-        # )
-        editor = param.config["editor"]["exe"]
-        cmdstr = f'"{editor}" "{sourcefile}"'
-        esp32common.run_program(cmdstr)
+        esp32common.run_program([esp32common.get_editor(), sourcefile])
 
     # -------------------------------------------------------------------------
     @cmd2.with_category(CMD_CAT_DEBUG)
@@ -974,8 +1409,7 @@ class ESPShell(cmd2.Cmd):
         """
 
         # print(statement)
-        # self.poutput(style(statement, fg=Fg.foreground_color))
-        self.poutput(style(statement))
+        self.poutput(style(statement, fg=self.FG_BY_NAME[self.foreground_color]))
 
     # -------------------------------------------------------------------------
     @cmd2.with_category(CMD_CAT_DEBUG)
@@ -986,7 +1420,10 @@ class ESPShell(cmd2.Cmd):
         if param.is_gui:
             pass  # This is implemented in esp32_gui_pyqt5.py in do_command()
         else:
-            os.system("cls")
+            # Clear the screen and the scrollback buffer, and move the cursor
+            # home, with ANSI escape sequences. This avoids starting a shell.
+            self.stdout.write("\x1b[2J\x1b[3J\x1b[H")
+            self.stdout.flush()
 
     # -------------------------------------------------------------------------
     sync_parser = argparse.ArgumentParser()
@@ -996,6 +1433,12 @@ class ESPShell(cmd2.Cmd):
         action="store_true",
         help="Start REPL and softreboot the device after all files are synced.",
     )
+    sync_parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Copy all files, also the ones which did not change since the last sync.",
+    )
 
     @with_argparser(sync_parser)
     @cmd2.with_category(CMD_CAT_FILES)
@@ -1005,13 +1448,21 @@ class ESPShell(cmd2.Cmd):
         Examples:
             * sync
             * sync -s or sync --start
+            * sync -f or sync --force
 
         If no foldername is given, then implicitly the internal source folder will be used.
         Does not support subfolders (yet).
 
+        Files which did not change since the last sync to this port are
+        skipped. Use --force to copy them anyway, e.g. after the files were
+        changed on the device itself. After rm and cleanfs, the removed files
+        are copied again by the next sync.
+        The hashes of the synced files are kept in esp32sync.json, next to
+        esp32cli.ini, so nothing is added to the source folder.
+
         """
 
-        debug(f"do_sync {statement=}")
+        debug(f"do_sync {statement.force=}")
         debug_indent("sync progress")
 
         sourcefolder = esp32common.get_sourcefolder()
@@ -1021,26 +1472,17 @@ class ESPShell(cmd2.Cmd):
             return
 
         print(f'Syncing all files from sourcefolder "{sourcefolder}" to device')
-        for filename in sourcefolder.glob("*"):
-            debug(f"{filename=}")
-            print(f" *  {filename}")
-            # self.stdout.flush()
-            if filename.is_file():
-                try:
-                    rfile_name = pathlib.Path(filename).name
-                    mpremote.main(
-                        [
-                            "connect",
-                            param.port_str,
-                            "cp",
-                            str(filename),
-                            ":" + rfile_name,
-                        ]
-                    )
-                except IOError as e:
-                    self.__error(str(e))
-            else:
-                print(f"cannot sync subolder {filename} (yet)")
+        manifest = load_sync_manifest(sourcefolder)
+        synced = manifest.setdefault(param.port_str, {})
+        files = _changed_files(sourcefolder, synced, statement.force)
+
+        # Copy all changed files in one go
+        try:
+            copied = put_many(list(files))
+        except IOError as e:
+            self.__error(str(e))
+        else:
+            _update_manifest(sourcefolder, manifest, synced, files, copied)
         print("\nSync completed")
         debug_unindent()
 
@@ -1048,10 +1490,9 @@ class ESPShell(cmd2.Cmd):
             print("Restarting device.")
             # All files are synced. Go to REPL mode and restart the device.
             if param.is_gui:
-                # First change to repl mode.
-                param.gui_mainwindow.change_to_repl_mode(None)
-                # Then send a CTRL+D to softreset the device
-                keyboard.press_and_release("ctrl+d")
+                # Change to repl mode, and then send a CTRL+D to softreset the device.
+                # This is done by the GUI thread, as this command runs in a worker thread.
+                param.gui_mainwindow.request_repl_mode(soft_reboot=True)
             else:
                 repl(reboot=True)
 
@@ -1074,6 +1515,14 @@ class ESPShell(cmd2.Cmd):
         help="Filenumber of the Micropython binfile to flash on the device",
     )
 
+    flash_parser.add_argument(
+        "-b",
+        "--baud",
+        type=int,
+        default=0,
+        help="Baudrate used to write the flash (default 921600)",
+    )
+
     @with_argparser(flash_parser)
     @cmd2.with_category(CMD_CAT_FILES)
     def do_flash(self, statement):
@@ -1082,12 +1531,12 @@ class ESPShell(cmd2.Cmd):
         If no file is given, a list of avaialble binfiles in the binfile folder will be shown.
         """
 
-        debug(f"{statement=}")
+        debug(f"{statement.binfile=} {statement.filenumber=}")
+
+        import esp32flash  # type: ignore
 
         # Check if we can find the esptool executable
-        esptool = pathlib.Path("../bin/esptool.exe").resolve()
-        if not esptool.is_file():
-            print(f"Error1: Could not find {str(esptool)}")
+        if not esp32flash.find_esptool():
             return
 
         # Try if this is a full path
@@ -1123,13 +1572,18 @@ class ESPShell(cmd2.Cmd):
             print(f"Could not find {str(binfile)}")
             return
 
+        # esptool needs the serial port for itself
+        release_remote()
+
         # Erase the flash
-        ret = esp32flash.erase_flash(self.port)
+        ret = esp32flash.erase_flash(param.port_str)
         if not ret:
             return
 
         # Program the binfile
-        ret = esp32flash.write_flash_with_binfile(param.port_str, binfile)
+        ret = esp32flash.write_flash_with_binfile(
+            param.port_str, binfile, baudrate=statement.baud
+        )
         if not ret:
             return
 
@@ -1138,6 +1592,9 @@ class ESPShell(cmd2.Cmd):
     def do_eraseflash(self, _statement) -> None:
         """Erase the flash memory of the connected device. This will also remove MicroPython itself !!!"""
 
+        import esp32flash  # type: ignore
+
+        release_remote()  # esptool needs the serial port for itself
         esp32flash.erase_flash(comport=param.port_str)
 
     # -------------------------------------------------------------------------
@@ -1145,7 +1602,8 @@ class ESPShell(cmd2.Cmd):
     def do_putty(self, _statement) -> None:
         """Start putty to connect to the device in REPL mode."""
 
-        esp32common.putty(self.port)
+        release_remote()  # putty needs the serial port for itself
+        esp32common.putty(param.port_str)
 
     # -------------------------------------------------------------------------
     @cmd2.with_category(CMD_CAT_WLAN)
@@ -1165,6 +1623,8 @@ class ESPShell(cmd2.Cmd):
             webrepl 192.168.192.169 henkiepenkie
         """
 
+        import webrepl  # type: ignore
+
         if statement.arg_list:
             ip = statement.arg_list[0]
             if len(statement.arg_list) > 1:
@@ -1214,7 +1674,9 @@ class ESPShell(cmd2.Cmd):
         """
 
         command = textwrap.dedent(command)
-        ret = mpremote.main(["connect", param.port_str, "exec", command])
+        ret = run_remote("exec", command)
+        # The device restarts, so the open connection can not be used anymore
+        close_remote()
         debug(f"{ret=}")
 
 
@@ -1313,7 +1775,11 @@ def main():
         debug(f"It is now {sys.argv=}")
 
     espshell = ESPShell(
-        not args.nocolor, not args.nocache, args.reset, args.noautoconnect
+        not args.nocolor,
+        not args.nocache,
+        args.reset,
+        args.noautoconnect,
+        use_startup_script=not args.noninteractive,
     )
 
     # if port:
@@ -1321,6 +1787,11 @@ def main():
     #         print(f"Automatic trying to use {port=}")
     #         mpfs.do_open(port)
 
+    # run_remote() keeps the connection open between the commands. Close it
+    # when the program ends, also after sys.exit(), so the device leaves the
+    # raw REPL and the port is freed.
+    atexit.register(close_remote)
+
     if args.command is not None:
         debug("Script commands are given")
         debug(f"{args.command=}")
@@ -1329,10 +1800,7 @@ def main():
             debug(f"{cmd=}")
             cmd = cmd.strip()
             if len(cmd) > 0 and not cmd.startswith("#"):
-                espshell.onecmd(cmd)
-                # alternatively:
-                # mpfs.onecmd_plus_hooks("{} {}".format(args.command, " ".join(args.command_args)))
-                # sys.exit(0)
+                espshell.onecmd_fast(cmd)
 
     if args.script:
         debug(f"{args.script=}")
@@ -1340,15 +1808,13 @@ def main():
         if platform.system() == "Windows":
             espshell.use_rawinput = True
 
-        f = open(args.script, "r")
-        script = ""
-
-        for line in f:
-
-            sline = line.strip()
-
-            if len(sline) > 0 and not sline.startswith("#"):
-                script += sline + "\n"
+        # Read the file at once, and join the lines once, instead of
+        # extending the script string for every line.
+        with open(args.script, "r") as f:
+            lines = [line.strip() for line in f.read().splitlines()]
+        script = "".join(
+            sline + "\n" for sline in lines if sline and not sline.startswith("#")
+        )
 
         if sys.version_info < (3, 0):
             sys.stdin = io.StringIO(script.decode("utf-8"))
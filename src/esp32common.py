@@ -10,15 +10,49 @@ import os
 import platform
 import shlex
 import time
+import operator
+import codecs
+import threading
 
 # 3rd party imports
 import serial.tools.list_ports  # type: ignore
-import keyboard
 
 # Local imports
 import param
 from lib.helper import debug, clear_debug_window, dumpArgs
 
+# The Path of the sourcefolder, and the configuration string it was made from.
+_sourcefolder_cache = ("", pathlib.Path(""))
+
+# Enumerating the serial ports is slow, so the result is kept for a short time.
+COMPORTS_CACHE_TTL = 1.0  # seconds
+_comports_cache = (0.0, None)  # (time of enumeration, list of ports)
+
+
+# -----------------------------------------------------------------------------
+def _comports() -> list:
+    """Get the list of serial ports, using a cached result if it is recent.
+
+    :returns: List of ListPortInfo objects
+    """
+
+    global _comports_cache
+
+    now = time.monotonic()
+    timestamp, ports = _comports_cache
+    if ports is None or now - timestamp >= COMPORTS_CACHE_TTL:
+        ports = serial.tools.list_ports.comports()
+        _comports_cache = (now, ports)
+    return ports
+
+
+# -----------------------------------------------------------------------------
+def clear_serial_ports_cache() -> None:
+    """Forget the cached list of serial ports, e.g. for a user triggered rescan."""
+
+    global _comports_cache
+    _comports_cache = (0.0, None)
+
 
 # -----------------------------------------------------------------------------
 def get_available_serial_ports(verbose=False, usb=True) -> tuple:
@@ -29,20 +63,23 @@ def get_available_serial_ports(verbose=False, usb=True) -> tuple:
     :returns: A list of the serial ports available on the system
     """
 
-    portlist = []
-    desclist = []
+    ports = _comports()
+
+    if verbose:
+        for p in sorted(ports, key=operator.attrgetter("device")):
+            print(f"{p.device} {p.description} {p.hwid}")
 
-    ports = serial.tools.list_ports.comports()
+    # Filter first, so only the ports which are returned have to be sorted.
+    if usb:  # If we should only return USB serial ports
+        ports = [p for p in ports if "USB" in p.description.upper()]
+    else:
+        ports = []
+    # Usually there is only one device connected, and nothing has to be sorted.
+    if len(ports) > 1:
+        ports.sort(key=operator.attrgetter("device"))
 
-    for port, desc, hwid in sorted(ports):
-        if verbose:
-            print(f"{port} {desc} {hwid}")
-        if usb:  # If we should only return USB serial ports
-            if "USB" in desc.upper():
-                portlist.append(port)
-                desclist.append(desc)
-        # else:
-        #     portlist.append(port)
+    portlist = [p.device for p in ports]
+    desclist = [p.description for p in ports]
     return portlist, desclist
 
 
@@ -80,6 +117,39 @@ def readconfig(filename="esp32cli.ini"):
     return config
 
 
+# -----------------------------------------------------------------------------
+def get_baudrate(config) -> int:
+    """Get the baudrate of the serial connection from the configuration.
+
+    :param config: configparser instance
+    :returns: The baudrate, 115200 if it is not (correctly) configured
+    """
+
+    # The value may be quoted in the INI file, like '115200'
+    value = config.get("com", "baudrate", fallback="115200").strip("'\" ")
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Invalid baudrate {value} in configuration, using 115200")
+        return 115200
+
+
+# -----------------------------------------------------------------------------
+def get_rtscts(config) -> bool:
+    """Get the use of RTS/CTS hardware flow control from the configuration.
+
+    :param config: configparser instance
+    :returns: True if flow control is enabled, False if it is not (correctly) configured
+    """
+
+    value = config.get("com", "rtscts", fallback="no").strip("'\" ")
+    try:
+        return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+    except KeyError:
+        print(f"Invalid rtscts {value} in configuration, using no")
+        return False
+
+
 # -----------------------------------------------------------------------------
 @dumpArgs
 def saveconfig(config, filename="esp32cli.ini"):
@@ -96,10 +166,11 @@ def saveconfig(config, filename="esp32cli.ini"):
 
 # -----------------------------------------------------------------------------
 @dumpArgs
-def set_sourcefolder(folder) -> bool:
+def set_sourcefolder(folder, save=True) -> bool:
     """Set sourcefolder in configuration
 
     :param folder: Foldername of the folder to change
+    :param save: If True, also save the configuration file
     :returns: True on success, False in case of an error
     """
 
@@ -111,7 +182,8 @@ def set_sourcefolder(folder) -> bool:
 
     param.config['src']['srcpath'] = str(foldername)
     debug(f"Set sourcefolder to {foldername}")
-    saveconfig(param.config)
+    if save:
+        saveconfig(param.config)
     return True
 
 
@@ -122,7 +194,13 @@ def get_sourcefolder() -> pathlib.Path:
     :returns: Path to sourcefolder
     """
 
-    folder = pathlib.Path(param.config['src']['srcpath'])
+    global _sourcefolder_cache
+
+    # Only create a new Path when the configured folder was changed
+    srcpath = param.config['src']['srcpath']
+    if srcpath != _sourcefolder_cache[0]:
+        _sourcefolder_cache = (srcpath, pathlib.Path(srcpath))
+    folder = _sourcefolder_cache[1]
     if folder.is_dir():
         return folder
 
@@ -130,6 +208,18 @@ def get_sourcefolder() -> pathlib.Path:
     return pathlib.Path("")
 
 
+# -----------------------------------------------------------------------------
+def get_editor() -> str:
+    """Get the editor to use.
+
+    The environment variable ESP32CLI_EDITOR overrules the configuration.
+
+    :returns: Path of the editor executable
+    """
+
+    return os.environ.get("ESP32CLI_EDITOR") or param.config["editor"]["exe"]
+
+
 # -----------------------------------------------------------------------------
 @dumpArgs
 def run_program(cmdstr) -> bool:
@@ -139,7 +229,8 @@ def run_program(cmdstr) -> bool:
 
     In case you want to run a text based application, use execute_command() instead.
 
-    :param cmdstr: The application to run.
+    :param cmdstr: The application to run. Preferably a list with the
+        application and its arguments, which needs no quoting.
     :returns: True in case of a normal termination of the application, False in case of an error.
     """
 
@@ -156,6 +247,28 @@ def run_program(cmdstr) -> bool:
         return False
 
 
+# -----------------------------------------------------------------------------
+def _print_and_collect(stream, chunks: list) -> None:
+    """Print the output of a process as soon as it arrives, and collect it.
+
+    :param stream: stdout or stderr pipe of the process
+    :param chunks: list to which the received bytestrings are appended
+    """
+
+    # The incremental decoder handles characters which are split over two reads
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        # read1() returns what is available (at most 4096 bytes), instead of
+        # waiting till the buffer is full.
+        data = stream.read1(4096)
+        if not data:
+            break
+        print(decoder.decode(data), end="", flush=True)
+        chunks.append(data)
+    # Show the bytes of a character which was cut off at the end of the output
+    print(decoder.decode(b"", final=True), end="", flush=True)
+
+
 # -----------------------------------------------------------------------------
 @dumpArgs
 def execute_command(command) -> tuple:
@@ -193,50 +306,45 @@ def execute_command(command) -> tuple:
         command_list, startupinfo=startupinfo, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False
     ) as proc:
 
-        total_std_output: bytes = b""
-        total_err_output: bytes = b""
-
-        while True:
-
-            err_output = b''
-            std_output = proc.stdout.read(1)
-
-            if not std_output:
-                err_output = proc.stderr.read(1)
-
-            if not std_output and not err_output and proc.poll() is not None:
-                break
+        # Collect the output in lists, and join them once at the end. This
+        # avoids copying the total output again for every new piece.
+        std_chunks: list = []
+        err_chunks: list = []
 
-            if std_output:
-                # Print the output, but also append it to the total output bytestring
-                print(std_output.decode(), end="", flush=True)
-                total_std_output += std_output
+        # Stderr is read in a separate thread. Otherwise a process which
+        # writes a lot to stderr would block, while we wait for stdout.
+        err_thread = threading.Thread(
+            target=_print_and_collect, args=(proc.stderr, err_chunks), daemon=True
+        )
+        err_thread.start()
+        _print_and_collect(proc.stdout, std_chunks)
+        err_thread.join()
 
-            if err_output:
-                # Print the error, but also append it to the total error bytestring
-                print(err_output.decode(), end="", flush=True)
-                total_err_output += err_output
-
-        proc.poll()
+        proc.wait()
 
     # Return the tuple of stdout and errout results.
-    return total_std_output, total_err_output
+    return b"".join(std_chunks), b"".join(err_chunks)
 
 
 # -----------------------------------------------------------------------------
-def putty(port) -> tuple:
+def putty(port) -> int:
     """Run putty.exe with the given arguments
 
+    Putty shows all output in its own window, so stdout and stderr are not
+    piped. This also avoids a deadlock on a full pipe buffer.
+
     :param port: Com port to use (string)
-    :returns: tuple of stdout and stderr text
+    :returns: The returncode of putty
     """
 
-    command_list = ["putty", "-serial", port, "-sercfg", "115200,8,n,1,N"]
+    flow_control = "R" if param.rtscts else "N"
+    sercfg = f"{param.baudrate},8,n,1,{flow_control}"
+    command_list = ["putty", "-serial", port, "-sercfg", sercfg]
     debug(f"Calling {' '.join(command_list)}")
 
-    with subprocess.Popen(
-        command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    ) as proc:
+    import keyboard  # Only needed here, so not imported at startup
+
+    with subprocess.Popen(command_list) as proc:
 
         # Wait some time, and then send Ctrl+b to exit raw repl (just to be sure).
         # We then should see the prompt:
@@ -245,9 +353,7 @@ def putty(port) -> tuple:
         time.sleep(0.2)
         keyboard.press_and_release('ctrl+b')
 
-        out, err = proc.communicate(input=b"\r\n")
-
-    return out.decode(), err.decode()
+        return proc.wait()
 
 
 # ===============================================================================
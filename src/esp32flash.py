@@ -13,8 +13,15 @@ import param
 import esp32common
 from lib.helper import debug
 
-# 3rd party imports
-from PyQt5.Qt import QEventLoop, QTimer
+# The esptool executable, in the bin folder next to the src folder.
+# Determined relative to this file, so it does not depend on the current folder.
+ESPTOOL = pathlib.Path(__file__).resolve().parent.parent / "bin" / "esptool.exe"
+
+_esptool_found = False  # Set when ESPTOOL was found, so it is checked only once
+
+# Baudrate used by esptool to write the flash. Most USB serial adapters of
+# ESP32 boards handle this; use a lower value (like 460800) if flashing fails.
+FLASH_BAUDRATE = 921600
 
 
 def find_esptool():
@@ -23,12 +30,15 @@ def find_esptool():
     :return: Full path to esptool.exe
     """
 
+    global _esptool_found
+
     # Check if we can find the esptool executable
-    esptool = pathlib.Path("../bin/esptool.exe")
-    if not esptool.is_file():
-        print(f"Error: Could not find {str(esptool)}")
-        return ""
-    return esptool
+    if not _esptool_found:
+        if not ESPTOOL.is_file():
+            print(f"Error: Could not find {str(ESPTOOL)}")
+            return ""
+        _esptool_found = True
+    return ESPTOOL
 
 # -----------------------------------------------------------------------------
 def erase_flash(comport="COM5") -> bool:
@@ -46,22 +56,19 @@ def erase_flash(comport="COM5") -> bool:
         comport = comport[:-1]
 
     print(f"Trying to erase flash over {comport=}")
-    cmdstr = f'"{esptool}" --chip esp32 --port {comport} erase_flash'
-    debug(f"Running {cmdstr}")
+    # Given as a list, so no quoting and splitting of the paths is needed
+    command = [str(esptool), "--chip", "esp32", "--port", comport, "erase_flash"]
+    debug(f"Running {command}")
     if param.is_gui:
         try:
-            param.worker.run_command(cmdstr)
-            while param.worker.active:
-                # The following 3 lines will do the same as time.sleep(1), but more PyQt5 friendly.
-                loop = QEventLoop()
-                QTimer.singleShot(250, loop.quit)
-                loop.exec_()
+            param.worker.run_command(command)
+            param.worker.wait()
         except Exception as err:
             print(err)
             return False
 
     # else:
-    out, err = esp32common.execute_command(cmdstr)
+    out, err = esp32common.execute_command(command)
     debug(f"eraseflash {out=} {err=}")
 
     if b"fatal error" in out.lower() or b"invalid head of packet" in out.lower():
@@ -70,14 +77,17 @@ def erase_flash(comport="COM5") -> bool:
 
 
 # -----------------------------------------------------------------------------
-def write_flash_with_binfile(comport="COM5", binfile=None) -> bool:
+def write_flash_with_binfile(comport="COM5", binfile=None, baudrate=None) -> bool:
     """Write flash of connected device with given binfile.
 
     :param comport: port to use
     :param binfile: file to write
+    :param baudrate: baudrate used by esptool, FLASH_BAUDRATE if not given
     :returns: True on success, False in case of an error
     """
 
+    baudrate = baudrate or FLASH_BAUDRATE
+
     # Remove a possible trailing colon
     if comport.endswith(":"):
         comport = comport[:-1]
@@ -93,21 +103,20 @@ def write_flash_with_binfile(comport="COM5", binfile=None) -> bool:
         return False
 
     print(f"Trying to write flash with {binfile}")
-    cmdstr = f'"{esptool}" --chip esp32 --port {comport} --baud 460800 write_flash -z 0x1000 "{binfile}"'
-    debug(f"{cmdstr=}")
+    command = [
+        str(esptool), "--chip", "esp32", "--port", comport, "--baud", str(baudrate),
+        "write_flash", "-z", "0x1000", str(binfile),
+    ]
+    debug(f"{command=}")
 
     if param.is_gui:
-        param.worker.run_command(cmdstr)
-        while param.worker.active:
-            # The following 3 lines will do the same as time.sleep(1), but more PyQt5 friendly.
-            loop = QEventLoop()
-            QTimer.singleShot(250, loop.quit)
-            loop.exec_()
+        param.worker.run_command(command)
+        param.worker.wait()
         return True
 
     # If we are here, then this was not the gui version, and have to run
     # this external command in a different way
-    out, err = esp32common.execute_command(cmdstr)
+    out, err = esp32common.execute_command(command)
     debug(f"write_flash_with_binfile {out=} {err=}")
     if b"fatal error" in out.lower() or b"invalid head of packet" in out.lower():
         return False
@@ -123,6 +132,7 @@ if __name__ == "__main__":
     parser.add_argument('-e', '--erase', action="store_true", help="erase flash")
     parser.add_argument('-p', '--port', type=str, default="auto", help="COM port to use, 'auto' will find active COM port")
     parser.add_argument('-f', '--file', type=str, default="", help="Micropython binfile to flash")
+    parser.add_argument('-b', '--baud', type=int, default=FLASH_BAUDRATE, help="baudrate used to write the flash")
     args = parser.parse_args()
 
     # Determine if a specific COM port was specified, or if the active port
@@ -145,6 +155,6 @@ if __name__ == "__main__":
 
     # If a filename was given, program the device with this file.
     if args.file:
-        success = write_flash_with_binfile(comport=port, binfile=args.file)
+        success = write_flash_with_binfile(comport=port, binfile=args.file, baudrate=args.baud)
         if not success:
             sys.exit(1)
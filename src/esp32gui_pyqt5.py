@@ -3,14 +3,15 @@
 # Global imports
 import sys
 import subprocess
+import concurrent.futures
 from enum import Enum
 
 # 3rd party imports
-from PyQt5 import QtCore, QtGui
+from PyQt5 import QtCore
 from PyQt5.QtWidgets import QApplication, QMainWindow
 from PyQt5.QtGui import QTextCursor
 from PyQt5.QtCore import pyqtSlot
-from PyQt5.Qt import QEventLoop, QTimer
+from PyQt5.Qt import QTimer
 
 # Local imports
 import param
@@ -24,6 +25,17 @@ from worker import Worker
 
 # constants
 
+# CLI commands are executed one at a time, outside the GUI thread. This keeps
+# the GUI responsive during long running commands, like file transfers.
+command_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+# Maximum number of lines (blocks) kept in the output window. Older lines
+# are removed, to limit the memory use and the cost of appending text.
+MAX_OUTPUT_BLOCKS = 5000
+
+# Bound once, as append_text() uses it for every piece of output
+_END = QTextCursor.End
+
 # MODE_COMMAND = 1
 # MODE_REPL = 2
 
@@ -123,6 +135,8 @@ class MainWindow(QMainWindow):
 
     # text_update = QtCore.Signal(str)        # PySide2
     text_update = QtCore.pyqtSignal(str)
+    repl_mode_request = QtCore.pyqtSignal(bool)
+    command_port_closed = QtCore.pyqtSignal(bool)
 
     def __init__(self):
         """Intialize the QT window."""
@@ -131,6 +145,7 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
+        self.ui.text_output.document().setMaximumBlockCount(MAX_OUTPUT_BLOCKS)
 
         param.worker = Worker()
         param.worker.outSignal.connect(self.append_text)
@@ -138,6 +153,13 @@ class MainWindow(QMainWindow):
         # After a command is entered, and ENTER is pressed, react on it
         self.ui.command_input.returnPressed.connect(self.do_entered_command)
 
+        # Saving the configuration is delayed a bit, so a burst of edits
+        # results in only one write of the configuration file.
+        self._save_timer = QtCore.QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(500)
+        self._save_timer.timeout.connect(lambda: esp32common.saveconfig(self.config))
+
         # After a new sourcepath is entered (and ENTER is pressed), react on it
         self.ui.lineEdit_srcpath.returnPressed.connect(self.get_ui_properties)
         self.ui.lineEdit_webrepl_ip.returnPressed.connect(self.get_ui_properties)
@@ -145,6 +167,7 @@ class MainWindow(QMainWindow):
 
         # Load the list of previous commands from the file in which they were saved.
         self.list_of_commands = list(set(load_command_list()))
+        self._commands_set = set(self.list_of_commands)  # For fast lookups, the list keeps the order
         for cmd_str in self.list_of_commands:
             s = cmd_str.strip()
             if s:
@@ -161,20 +184,18 @@ class MainWindow(QMainWindow):
         # Handle the buttonclick for webrepl mode
         self.ui.pushButton_webrepl.clicked.connect(self.webrepl)
 
-        # Read configuration
-        self.config = esp32common.readconfig("esp32cli.ini")
-        param.config = self.config
+        # Commands which are handled by the GUI itself, instead of by the cli
+        self._special_commands = {
+            "cls": self.clear_output,
+            "repl": self.change_to_repl_mode,
+            "cmd": self.change_to_command_mode,
+            "test": self.run_test_command,
+        }
 
-        self.port, desc = esp32common.get_active_comport()
-        self.config["com"]["port"] = self.port
-        self.config["com"]["desc"] = desc
-        param.port_str = self.port
-        debug(f"Possible active com port is {self.port}")
-
-        # If neccessary, set properties of some elements
-        self.set_ui_properties()
+        self.port = ""  # Will be determined in _late_init()
 
         self.mode = Mode.COMMAND                 # Start in Command mode
+        self.repl_switch_pending = False        # Waiting for the switch to repl mode
         self.repl_method = ReplMode.INTERNAL    # Default repl method is INTERNAL (others are PUTTY and ...)
 
         debug(f"sys.stdout was {sys.stdout=}")
@@ -185,16 +206,48 @@ class MainWindow(QMainWindow):
         self.text_update.connect(
             self.append_text
         )  # noqa # Connect text update to handler
+        self.repl_mode_request.connect(self.on_repl_mode_request)
+        # Emitted from the command executor thread, so always queue it
+        self.command_port_closed.connect(
+            self.on_command_port_closed, QtCore.Qt.QueuedConnection
+        )
         self.ui.command_input.setFocus()
 
+        param.gui_mainwindow = self
+
+        # Reading the configuration and searching for the serial port takes
+        # some time. Do this after the window has been shown for the first time.
+        QTimer.singleShot(0, self._late_init)
+
+    # -------------------------------------------------------------------------
+    def _late_init(self) -> None:
+        """Perform the part of the initialisation which may take some time.
+
+        This is called from the event loop, just after the window is shown.
+
+        :returns: Nothing
+        """
+
+        # Read configuration
+        self.config = esp32common.readconfig("esp32cli.ini")
+        param.config = self.config
+
+        self.port, desc = esp32common.get_active_comport()
+        self.config["com"]["port"] = self.port
+        self.config["com"]["desc"] = desc
+        param.port_str = self.port
+        debug(f"Possible active com port is {self.port}")
+
+        # If neccessary, set properties of some elements
+        self.set_ui_properties()
+
         # Prepare the repl window, but do not open a connection yet.
         # This should only be done when repl becomes active.
-        self.repl_connection = qt5_repl_gui.REPLConnection(self.port, 115200)
+        baudrate = esp32common.get_baudrate(self.config)
+        self.repl_connection = qt5_repl_gui.REPLConnection(self.port, baudrate)
         self.ui.ReplPane.set_connection(self.repl_connection)
         self.repl_connection.data_received.connect(self.ui.ReplPane.process_tty_data)
 
-        param.gui_mainwindow = self
-
         self.cmdlineapp = esp32cli.ESPShell(port=self.port)
 
     # -------------------------------------------------------------------------
@@ -205,7 +258,7 @@ class MainWindow(QMainWindow):
         :return: Nothing
         """
 
-        debug(f"write({text=})")
+        # debug(f"write({text=})")
         self.text_update.emit(
             text
         )  # noqa # Send signal to synchronise call with main thread # noqa
@@ -220,20 +273,21 @@ class MainWindow(QMainWindow):
         """
 
         # debug(f"append_text(\"{text}\")")
-        cur = self.ui.text_output.textCursor()
-        cur.movePosition(QtGui.QTextCursor.End)  # Move cursor to end of text
-        s = str(text)
-        while s:
-            head, sep, s = s.partition("\n")  # Split line at LF
-            head = head.replace(
-                "\r", ""
-            )  # Remove the Carriage Returns to avoid double linespacing.
-            cur.insertText(head)  # Insert text at cursor
-            if sep:  # New line if LF
-                cur.insertBlock()
-        self.ui.text_output.setTextCursor(cur)  # Update visible cursor
-        self.ui.text_output.update()
-        QApplication.processEvents()
+        text_output = self.ui.text_output
+        cur = text_output.textCursor()
+        cur.movePosition(_END)  # Move cursor to end of text
+        # Remove the Carriage Returns to avoid double linespacing, and insert
+        # the text in one go. QTextCursor.insertText() creates a new block for
+        # every LF, so there is no need to split the text in lines first.
+        # A single str.replace() over the whole text is one C-level pass, and
+        # is faster than re.sub() for a single character.
+        cur.insertText(text.replace("\r", ""))
+        text_output.setTextCursor(cur)  # Update visible cursor
+        # Do not call QApplication.processEvents() here. This slot is called
+        # from the event loop, and re-entering it would handle user input and
+        # other queued text in the middle of this update. The repaint is done
+        # as soon as control returns to the event loop.
+        text_output.update()
 
     @staticmethod
     def flush() -> None:
@@ -335,21 +389,26 @@ class MainWindow(QMainWindow):
 
         # Open the serial connection for the commandline mode
         debug("Open the serial connection for the commandline mode")
-        self.cmdlineapp.onecmd_plus_hooks(f"open {self.port}")
+        command_executor.submit(self.cmdlineapp.onecmd_plus_hooks, f"open {self.port}")
 
         self.ui.command_input.setFocus()
-        debug(f"now sys.stdout was {sys.stdout=}")
-        sys.stdout = self
-        debug(f"now sys.stdout is {sys.stdout=}")
+        if sys.stdout is not self:
+            sys.stdout = self
 
         return self.mode
 
     # -------------------------------------------------------------------------
     @dumpArgs
-    def change_to_repl_mode(self, _param) -> Mode:
+    def change_to_repl_mode(self, _param=None, soft_reboot=False) -> Mode:
         """Switch to REPL mode.
 
-        :returns: New mode
+        The serial connection for the commandline mode is closed first, after
+        the commands which are still queued. The actual switch is done in
+        on_command_port_closed() when that is done, so the GUI is not blocked
+        in the meantime.
+
+        :param soft_reboot: If True, soft reboot the device after switching to REPL mode.
+        :returns: Current mode, which is still COMMAND while the switch is pending
         """
 
         debug("=====")
@@ -357,11 +416,34 @@ class MainWindow(QMainWindow):
 
         if self.mode == Mode.REPL:
             debug("Already in REPL mode")
+            if soft_reboot:
+                self.repl_connection.write(qt5_repl_gui.SOFT_REBOOT)
+            return self.mode
+
+        if self.repl_switch_pending:
+            debug("Already switching to REPL mode")
             return self.mode
 
-        # Close the serial connection for the commandline mode
-        # This will execute do_close()
-        self.cmdlineapp.onecmd_plus_hooks("close")
+        # Close the serial connection for the commandline mode. This will
+        # execute do_close(). The port can not be opened by the repl
+        # connection before it is closed.
+        self.repl_switch_pending = True
+        future = command_executor.submit(self.cmdlineapp.onecmd_plus_hooks, "close")
+        future.add_done_callback(
+            lambda _future: self.command_port_closed.emit(soft_reboot)
+        )
+        return self.mode
+
+    # -------------------------------------------------------------------------
+    @pyqtSlot(bool)
+    def on_command_port_closed(self, soft_reboot: bool) -> None:
+        """Finish the switch to REPL mode, after the commandline connection has been closed.
+
+        :param soft_reboot: If True, soft reboot the device by sending CTRL+D.
+        :returns: Nothing
+        """
+
+        self.repl_switch_pending = False
 
         self.mode = Mode.REPL
         self.change_radiobuttons_to_current_mode()
@@ -380,7 +462,9 @@ class MainWindow(QMainWindow):
             self.repl_connection.send_exit_raw_mode()
             # return MODE_REPL
             self.mode = Mode.REPL
-            return self.mode
+            if soft_reboot:
+                self.repl_connection.write(qt5_repl_gui.SOFT_REBOOT)
+            return
 
         # elif self.repl_method == ReplMode.PUTTY:
         #     esp32common.putty("COM4:")
@@ -397,7 +481,29 @@ class MainWindow(QMainWindow):
         #     print(f"ERROR: Unknown repl {self.repl_method=}")
 
         self.mode = Mode.COMMAND
-        return self.mode
+
+    # -------------------------------------------------------------------------
+    def request_repl_mode(self, soft_reboot=False) -> None:
+        """Ask the GUI thread to switch to REPL mode.
+
+        This can be called from a CLI command, which does not run in the GUI thread.
+
+        :param soft_reboot: If True, soft reboot the device after switching to REPL mode.
+        :returns: Nothing
+        """
+
+        self.repl_mode_request.emit(soft_reboot)  # noqa # Handled by on_repl_mode_request in the GUI thread
+
+    # -------------------------------------------------------------------------
+    @pyqtSlot(bool)
+    def on_repl_mode_request(self, soft_reboot: bool) -> None:
+        """Switch to REPL mode, as requested by request_repl_mode().
+
+        :param soft_reboot: If True, soft reboot the device by sending CTRL+D.
+        :returns: Nothing
+        """
+
+        self.change_to_repl_mode(soft_reboot=soft_reboot)
 
     # -------------------------------------------------------------------------
     def webrepl(self) -> None:
@@ -428,7 +534,7 @@ class MainWindow(QMainWindow):
 
         # Save GUI settings
         srcpath = self.ui.lineEdit_srcpath.text()
-        esp32common.set_sourcefolder(srcpath)
+        esp32common.set_sourcefolder(srcpath, save=False)
 
         webrepl_ip = self.ui.lineEdit_webrepl_ip.text()
         self.config["webrepl"]["ip"] = webrepl_ip
@@ -436,8 +542,21 @@ class MainWindow(QMainWindow):
         webrepl_password = self.ui.lineEdit_webrepl_password.text()
         self.config["webrepl"]["password"] = webrepl_password
 
-        # Save the (modified configuration file)
-        esp32common.saveconfig(self.config)
+        # Save the (modified configuration file), after a short delay
+        self._save_timer.start()
+
+    # -------------------------------------------------------------------------
+    def closeEvent(self, event) -> None:
+        """Save a pending configuration change before the window is closed.
+
+        :param event: The QCloseEvent
+        :returns: Nothing
+        """
+
+        if self._save_timer.isActive():
+            self._save_timer.stop()
+            esp32common.saveconfig(self.config)
+        super().closeEvent(event)
 
     # -------------------------------------------------------------------------
     @dumpFuncname
@@ -476,13 +595,22 @@ class MainWindow(QMainWindow):
         :returns: Nothing
         """
 
-        if out:
-            self.ui.text_output.append(out)
+        if not out and not err:
+            return
 
-        if err:
-            self.ui.text_output.append("ERROR: ")
-            self.ui.text_output.append(err)
-            self.ui.text_output.update()
+        # Disable the updates while appending, so the widget is repainted
+        # only once, instead of after every single append.
+        text_output = self.ui.text_output
+        text_output.setUpdatesEnabled(False)
+        try:
+            if out:
+                text_output.append(out)
+            if err:
+                text_output.append("ERROR: ")
+                text_output.append(err)
+        finally:
+            text_output.setUpdatesEnabled(True)
+            text_output.update()
 
     # -------------------------------------------------------------------------
     def show_text(self, text: str) -> None:
@@ -522,6 +650,7 @@ class MainWindow(QMainWindow):
         index = self.list_of_commands.index(cmd)
         debug(f"Found {cmd} at index {index}")
         self.list_of_commands.remove(cmd)
+        self._commands_set.discard(cmd)
         save_command_list(self.list_of_commands)    # Save the new list in a file
 
         debug("Removing item from commandlist")
@@ -542,6 +671,29 @@ class MainWindow(QMainWindow):
         cmd = self.ui.command_input.text()
         self.do_command(cmd_str=cmd)
 
+    # -------------------------------------------------------------------------
+    def clear_output(self) -> None:
+        """Make the output windows empty.
+
+        :returns: Nothing
+        """
+
+        debug("Clearing output windows.")
+        self.ui.text_output.setText("")
+        self.ui.ReplPane.setText("")
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def run_test_command() -> None:
+        """Run a test command in the worker, and wait till it is done.
+
+        :returns: Nothing
+        """
+
+        param.worker.run_command("ping 127.0.0.1")
+        param.worker.wait()
+        # param.worker.run_command("ping 192.168.178.1")
+
     # -------------------------------------------------------------------------
     def do_command(self, cmd_str=None) -> None:
         """Execute the given command.
@@ -565,42 +717,38 @@ class MainWindow(QMainWindow):
         # At the end, the last command will be added to a list of commands.
 
         debug(f"do_command {cmd_str=}")
+        cmd_str = (cmd_str or "").strip()
         if not cmd_str:
             debug("ERROR: No command given")
+            return
+
+        # A command would open the serial port again, which the REPL
+        # connection is about to use. Keep it in the input box instead.
+        if self.repl_switch_pending:
+            self.show_text("Switching to REPL mode, please try again when it is done")
+            return
 
         # if not self.mode == MODE_COMMAND:
         if not self.mode == Mode.COMMAND:
             debug("We were not in command mode, switching to command mode now")
             self.change_to_command_mode()
 
-        if cmd_str == "cls":
-            debug("Clearing output windows.")
-            self.ui.text_output.setText("")
-            self.ui.ReplPane.setText("")
-        elif cmd_str == "repl":
-            self.change_to_repl_mode()
-        elif cmd_str == "cmd":
-            self.change_to_command_mode()
-        elif cmd_str == "test":
-            param.worker.run_command("ping 127.0.0.1")
-            while param.worker.active:
-                # The following 3 lines will do the same as time.sleep(1), but more PyQt5 friendly.
-                loop = QEventLoop()
-                QTimer.singleShot(250, loop.quit)
-                loop.exec_()
-            # param.worker.run_command("ping 192.168.178.1")
+        special_command = self._special_commands.get(cmd_str)
+        if special_command:
+            special_command()
         else:
             debug(f"starting cmdlineapp.onecme_plus_hooks({'cmd_str'})")
-            self.cmdlineapp.onecmd_plus_hooks(cmd_str)
+            command_executor.submit(self.cmdlineapp.onecmd_plus_hooks, cmd_str)
         # Clear the input window. This also indicates that the
-        # command was executed without problem.
+        # command was accepted.
         self.ui.command_input.clear()
 
         # If this command is not in the list of commands entered till now,
         # add it and save the list in a text file.
-        if cmd_str.strip() not in self.list_of_commands:
-            self.list_of_commands.append(cmd_str.strip())
-            self.ui.commandlist.addItem(cmd_str.strip())
+        if cmd_str not in self._commands_set:
+            self._commands_set.add(cmd_str)
+            self.list_of_commands.append(cmd_str)
+            self.ui.commandlist.addItem(cmd_str)
             save_command_list(self.list_of_commands)
 
 
@@ -32,6 +32,10 @@ class ConsolePosix:
         termios.tcsetattr(self.infd, termios.TCSANOW, self.orig_attr)
 
     def waitchar(self, pyb_serial):
+        # Bytes which were already fetched from the port are not signalled
+        # by select()
+        if getattr(pyb_serial, "buf", None):
+            return
         # TODO pyb_serial might not have fd
         select.select([self.infd, pyb_serial.fd], [], [])
 
@@ -26,6 +26,15 @@ from .console import Console, ConsolePosix
 
 _PROG = "mpremote"
 
+# Serial settings used for new connections. The baudrate has to match the
+# baudrate of the REPL on the device.
+baudrate = 115200
+rtscts = False  # Use RTS/CTS hardware flow control
+
+# Connections which are kept open between calls of main(persistent=True),
+# indexed by device name.
+_connections = {}
+
 _BUILTIN_COMMAND_EXPANSIONS = {
     # Device connection shortcuts.
     "devs": "connect list",
@@ -100,6 +109,10 @@ def load_user_config():
     return config
 
 
+# Command expansions, prepared from the user config on the first call of main()
+_command_expansions = None
+
+
 def prepare_command_expansions(config):
     global _command_expansions
 
@@ -181,7 +194,7 @@ def do_connect(args):
             # Auto-detect and auto-connect to the first available device.
             for p in sorted(serial.tools.list_ports.comports()):
                 try:
-                    return pyboard.PyboardExtended(p.device, baudrate=115200)
+                    return pyboard.PyboardExtended(p.device, baudrate=baudrate, rtscts=rtscts)
                 except pyboard.PyboardError as er:
                     if not er.args[0].startswith("failed to access"):
                         raise er
@@ -192,13 +205,13 @@ def do_connect(args):
             dev = None
             for p in serial.tools.list_ports.comports():
                 if p.serial_number == serial_number:
-                    return pyboard.PyboardExtended(p.device, baudrate=115200)
+                    return pyboard.PyboardExtended(p.device, baudrate=baudrate, rtscts=rtscts)
             raise pyboard.PyboardError("no device with serial number {}".format(serial_number))
         else:
             # Connect to the given device.
             if dev.startswith("port:"):
                 dev = dev[len("port:") :]
-            return pyboard.PyboardExtended(dev, baudrate=115200)
+            return pyboard.PyboardExtended(dev, baudrate=baudrate, rtscts=rtscts)
     except pyboard.PyboardError as er:
         msg = er.args[0]
         if msg.startswith("failed to access"):
@@ -254,6 +267,14 @@ def do_filesystem(pyb, args):
     args.clear()
 
 
+# How each received byte is shown in the REPL: printable characters and the
+# usual control characters as they are, anything else as a hex value.
+_REPL_OUTPUT = [
+    bytes([c]) if c in (8, 9, 10, 13, 27) or 32 <= c <= 126 else b"[%02x]" % c
+    for c in range(256)
+]
+
+
 def do_repl_main_loop(pyb, console_in, console_out_write, *, code_to_inject, file_to_inject):
     while True:
         console_in.waitchar(pyb.serial)
@@ -288,14 +309,11 @@ def do_repl_main_loop(pyb, console_in, console_out_write, *, code_to_inject, fil
                 break
 
         if n > 0:
-            c = pyb.serial.read(1)
-            if c is not None:
-                # pass character through to the console
-                oc = ord(c)
-                if oc in (8, 9, 10, 13, 27) or 32 <= oc <= 126:
-                    console_out_write(c)
-                else:
-                    console_out_write(b"[%02x]" % ord(c))
+            # Pass all waiting characters through to the console at once,
+            # instead of one console write per character.
+            data = pyb.serial.read(n)
+            if data:
+                console_out_write(b"".join([_REPL_OUTPUT[c] for c in data]))
 
 
 def do_repl(pyb, args):
@@ -366,9 +384,97 @@ def execbuffer(pyb, buf, follow):
     return ret_val
 
 
-def main(args=None):
-    config = load_user_config()
-    prepare_command_expansions(config)
+def open_connection(dev):
+    """Open a connection to the device, and keep it for main(persistent=True).
+
+    :param dev: Device name to connect to
+    """
+    if dev not in _connections:
+        pyb = do_connect([dev])
+        if pyb is not None:
+            _connections[dev] = pyb
+
+
+def is_alive(pyb):
+    """Check if the serial port of a kept connection can still be used.
+
+    This only asks the driver for the number of waiting bytes, so nothing
+    is sent to the device. It fails when the device was unplugged or reset
+    through USB in the meantime.
+
+    :param pyb: Connection to check
+    :returns: True if the connection can be used, False if not
+    """
+    # Ask the driver itself, not a buffer in front of it
+    port = getattr(pyb.serial, "orig_serial", pyb.serial)
+    try:
+        port.inWaiting()
+    except OSError:
+        return False
+    return True
+
+
+def release_connection(dev=None):
+    """Free the serial port of a connection which was kept open by main(persistent=True).
+
+    Unlike close_connection(), the connection itself is kept. The next
+    main(persistent=True) for the same device opens the port again, without
+    setting up a new connection.
+
+    :param dev: Device name of the connection to release, None to release all
+    """
+    devs = list(_connections) if dev is None else [dev]
+    for dev in devs:
+        pyb = _connections.get(dev)
+        if pyb is None:
+            continue
+        if not hasattr(pyb.serial, "orig_serial"):
+            # Only a serial port can be opened again
+            close_connection(dev)
+            continue
+        try:
+            if pyb.in_raw_repl:
+                pyb.exit_raw_repl()
+        except OSError:
+            pass
+        pyb.close()
+
+
+def reopen_connection(pyb):
+    """Open the serial port of a released connection again.
+
+    :param pyb: Connection which was released with release_connection()
+    :returns: The connection, or None if the port could not be opened again
+    """
+    port = getattr(pyb.serial, "orig_serial", None)
+    if port is not None and not port.is_open:
+        try:
+            pyb.reopen()
+            return pyb
+        except OSError:
+            pass
+    do_disconnect(pyb)
+    return None
+
+
+def close_connection(dev=None):
+    """Close a connection which was kept open by main(persistent=True).
+
+    :param dev: Device name of the connection to close, None to close all
+    """
+    devs = list(_connections) if dev is None else [dev]
+    for dev in devs:
+        pyb = _connections.pop(dev, None)
+        if pyb is not None:
+            do_disconnect(pyb)
+
+
+def main(args=None, persistent=False):
+    # The user config is only read once, as main() is called for every
+    # command when mpremote is used from within another program.
+    if _command_expansions is None:
+        config = load_user_config()
+        prepare_command_expansions(config)
 
     # print(f"main {sys.argv=}")
     # print(f"main {args=}")
@@ -376,7 +482,9 @@ def main(args=None):
     if not args:
         args = sys.argv[1:]
     pyb = None
+    dev = None
     did_action = False
+    failed = False
 
     try:
         while args:
@@ -397,15 +505,26 @@ def main(args=None):
                 need_raw_repl, is_action, num_args_min = cmds[cmd]
             except KeyError:
                 print(f"{_PROG}: '{cmd}' is not a command")
-                return 1
+                return b""
 
             if len(args) < num_args_min:
                 print(f"{_PROG}: '{cmd}' neads at least {num_args_min} argument(s)")
-                return 1
+                return b""
 
             if cmd == "connect":
                 if pyb is not None:
                     do_disconnect(pyb)
+                dev = args[0]
+                if persistent and dev in _connections:
+                    # Reuse the connection kept open by a previous call. A
+                    # released port is opened again, and a port which has
+                    # gone away in the meantime is connected anew.
+                    pyb = _connections.pop(dev)
+                    if not is_alive(pyb):
+                        pyb = reopen_connection(pyb)
+                    if pyb is not None:
+                        args.pop(0)
+                        continue
                 pyb = do_connect(args)
                 if pyb is None:
                     did_action = True
@@ -447,12 +566,16 @@ def main(args=None):
                             buf = f.read()
                     except OSError:
                         print(f"{_PROG}: could not read file '{filename}'")
-                        return 1
+                        return b""
                 ret = execbuffer(pyb, buf, follow)
                 # print(f"after execbuffer(), {ret=}, {get_last_output()=}")
                 if ret:
-                    return ret
+                    # The program failed or was interrupted, and may still be
+                    # running. Do not keep this connection.
+                    failed = True
+                    return get_last_output()
             elif cmd == "fs":
+                reset_last_output()     # Clear buffer in which the last output was written
                 do_filesystem(pyb, args)
             elif cmd == "repl":
                 do_repl(pyb, args)
@@ -463,8 +586,16 @@ def main(args=None):
             if pyb.in_raw_repl:
                 pyb.exit_raw_repl()
             do_repl(pyb, args)
+    except BaseException:
+        # Do not keep a connection which may be in an unknown state
+        failed = True
+        raise
     finally:
         if pyb is not None:
-            do_disconnect(pyb)
-        return get_last_output()
+            if persistent and not failed and dev is not None and not pyb.mounted:
+                _connections[dev] = pyb
+            else:
+                do_disconnect(pyb)
+
+    return get_last_output()
 
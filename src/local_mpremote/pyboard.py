@@ -82,6 +82,10 @@ global last_output
 
 last_output = b""
 
+# Number of bytes which are transferred per exec_() call by fs_put(), fs_get()
+# and fs_cat(). Larger chunks need less round trips to the device.
+transfer_chunk_size = 4096
+
 
 def reset_last_output():
     global last_output
@@ -92,6 +96,18 @@ def get_last_output():
     return last_output
 
 
+# Source files which were copied by the last "cp" filesystem command
+last_copied = []
+
+
+def reset_last_copied():
+    del last_copied[:]
+
+
+def get_last_copied():
+    return last_copied
+
+
 def stdout_write_bytes(b):
     global last_output
 
@@ -106,6 +122,56 @@ class PyboardError(Exception):
     pass
 
 
+class BufferedSerial:
+    """Serial port, from which the received bytes are fetched in blocks.
+
+    read_until() takes one byte at a time, and asks for the number of
+    waiting bytes before each of them. Both are driver calls, which are slow
+    on Windows. This fetches all waiting bytes at once, and hands them out
+    from a local buffer.
+    """
+
+    def __init__(self, serial):
+        self.orig_serial = serial
+        self.buf = bytearray()
+
+    def __getattr__(self, name):
+        return getattr(self.orig_serial, name)
+
+    @property
+    def timeout(self):
+        return self.orig_serial.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.orig_serial.timeout = value
+
+    def inWaiting(self):
+        if self.buf:
+            return len(self.buf)
+        return self.orig_serial.in_waiting
+
+    def read(self, size=1):
+        missing = size - len(self.buf)
+        if missing > 0:
+            # Fetch everything the driver has, and at least the missing bytes
+            self.buf += self.orig_serial.read(max(missing, self.orig_serial.in_waiting))
+        data = bytes(self.buf[:size])
+        del self.buf[:size]
+        return data
+
+    def write(self, data):
+        return self.orig_serial.write(data)
+
+    def open(self):
+        self.buf.clear()
+        self.orig_serial.open()
+
+    def close(self):
+        self.buf.clear()
+        self.orig_serial.close()
+
+
 class TelnetToSerial:
     def __init__(self, ip, user, password, read_timeout=None):
         self.tn = None
@@ -280,9 +346,11 @@ class Pyboard:
         password="python",
         wait=0,
         exclusive=True,
+        rtscts=False,
     ):
         self.in_raw_repl = False
         self.use_raw_paste = True
+        self.hw_flow_control = False
         if device.startswith("exec:"):
             self.serial = ProcessToSerial(device[len("exec:") :])
         elif device.startswith("execpty:"):
@@ -300,6 +368,9 @@ class Pyboard:
 
             # Set options, and exclusive if pyserial supports it
             serial_kwargs = {"baudrate": baudrate, "interCharTimeout": 1}
+            if rtscts:
+                serial_kwargs["rtscts"] = True
+                self.hw_flow_control = True
             if serial.__version__ >= "3.3":
                 serial_kwargs["exclusive"] = exclusive
 
@@ -323,6 +394,26 @@ class Pyboard:
                 raise PyboardError("failed to access " + device)
             if delayed:
                 print("")
+            self.serial = BufferedSerial(self.serial)
+            self.set_low_latency_mode()
+
+    def set_low_latency_mode(self):
+        # USB serial adapters may hold back received bytes for up to
+        # 16ms. Ask for low latency mode where pyserial supports it
+        # (Linux); drivers which do not support it are left as they are.
+        if hasattr(self.serial, "set_low_latency_mode"):
+            try:
+                self.serial.set_low_latency_mode(True)
+            except (OSError, ValueError):
+                pass
+
+    def reopen(self):
+        # Open the serial port again after close(), with the same settings.
+        # The device may have been reset in the meantime, so it is not
+        # assumed to be in the raw REPL anymore.
+        self.in_raw_repl = False
+        self.serial.open()
+        self.set_low_latency_mode()
 
     def close(self):
         self.serial.close()
@@ -334,6 +425,10 @@ class Pyboard:
         data = self.serial.read(min_num_bytes)
         if data_consumer:
             data_consumer(data)
+        else:
+            # A bytearray can be extended in place, while "data + new_data"
+            # copies all data received so far for every new byte.
+            data = bytearray(data)
         timeout_count = 0
         while True:
             if data.endswith(ending):
@@ -344,14 +439,14 @@ class Pyboard:
                     data_consumer(new_data)
                     data = new_data
                 else:
-                    data = data + new_data
+                    data += new_data
                 timeout_count = 0
             else:
                 timeout_count += 1
                 if timeout is not None and timeout_count >= 100 * timeout:
                     break
                 time.sleep(0.01)
-        return data
+        return bytes(data)
 
     def enter_raw_repl(self, soft_reset=True):
         self.serial.write(b"\r\x03\x03")  # ctrl-C twice: interrupt any running program
@@ -474,10 +569,15 @@ class Pyboard:
             # Don't try to use raw-paste mode again for this connection.
             self.use_raw_paste = False
 
-        # Write command using standard raw REPL, 256 bytes every 10ms.
-        for i in range(0, len(command_bytes), 256):
-            self.serial.write(command_bytes[i : min(i + 256, len(command_bytes))])
-            time.sleep(0.01)
+        if self.hw_flow_control:
+            # The device pauses the transfer itself with RTS/CTS, so the
+            # command can be written at once.
+            self.serial.write(command_bytes)
+        else:
+            # Write command using standard raw REPL, 256 bytes every 10ms.
+            for i in range(0, len(command_bytes), 256):
+                self.serial.write(command_bytes[i : min(i + 256, len(command_bytes))])
+                time.sleep(0.01)
         self.serial.write(b"\x04")
 
         # check if we could exec command
@@ -517,14 +617,16 @@ class Pyboard:
         )
         self.exec_(cmd, data_consumer=stdout_write_bytes)
 
-    def fs_cat(self, src, chunk_size=256):
+    def fs_cat(self, src, chunk_size=None):
+        chunk_size = chunk_size or transfer_chunk_size
         cmd = (
             "with open('%s') as f:\n while 1:\n"
             "  b=f.read(%u)\n  if not b:break\n  print(b,end='')" % (src, chunk_size)
         )
         self.exec_(cmd, data_consumer=stdout_write_bytes)
 
-    def fs_get(self, src, dest, chunk_size=256):
+    def fs_get(self, src, dest, chunk_size=None):
+        chunk_size = chunk_size or transfer_chunk_size
         self.exec_("f=open('%s','rb')\nr=f.read" % src)
         with open(dest, "wb") as f:
             while True:
@@ -546,9 +648,17 @@ class Pyboard:
                 f.write(data)
         self.exec_("f.close()")
 
-    def fs_put(self, src, dest, chunk_size=256):
-        self.exec_("f=open('%s','wb')\nw=f.write" % dest)
+    def fs_put(self, src, dest, chunk_size=None):
+        chunk_size = chunk_size or transfer_chunk_size
         with open(src, "rb") as f:
+            data = f.read(chunk_size)
+            if len(data) < chunk_size:
+                # The whole file fits in one chunk, so open, write and close
+                # it on the device in one round trip.
+                self.exec_("with open('%s','wb') as f:\n f.write(%r)" % (dest, data))
+                return
+            # Send the first chunk together with the open
+            self.exec_("f=open('%s','wb')\nw=f.write\nw(%r)" % (dest, data))
             while True:
                 data = f.read(chunk_size)
                 if not data:
@@ -614,11 +724,13 @@ def filesystem_command(pyb, args):
             else:
                 op = pyb.fs_get
                 fmt = "cp :%s %s"
+            reset_last_copied()
             for src in srcs:
                 src = fname_remote(src)
                 dest2 = fname_cp_dest(src, dest)
                 print(fmt % (src, dest2))
                 op(src, dest2)
+                last_copied.append(src)
         else:
             op = {
                 "ls": pyb.fs_ls,
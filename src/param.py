@@ -11,6 +11,10 @@ worker = None
 
 port_str = ''           # Port string, like "COM10", "COM4"
 
+transfer_buffer_size = 4096     # Number of bytes per transfer step of put/get/cat
+baudrate = 115200       # Baudrate of the serial connection, must match the device
+rtscts = False          # Use RTS/CTS hardware flow control on the serial connection
+
 # ===============================================================================
 if __name__ == "__main__":
 
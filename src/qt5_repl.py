@@ -137,7 +137,7 @@ class REPLConnection(QObject):
         """Called when data is ready to be send from the device.
         """
         data = bytes(self.serial.readAll())
-        debug(f"_on_serial_read() Received {data=}")
+        # debug(f"_on_serial_read() Received {data=}")
         self.data_received.emit(data)
 
     # -------------------------------------------------------------------------
@@ -145,7 +145,7 @@ class REPLConnection(QObject):
         """Read the available bytes from the serial port.
         """
         data = bytes(self.serial.readAll())
-        debug(f"read() Received {data=}")
+        # debug(f"read() Received {data=}")
         return data
 
     # -------------------------------------------------------------------------
@@ -155,7 +155,7 @@ class REPLConnection(QObject):
         :param data: data to write
         :returns: Nothing
         """
-        debug(f"Serial write {data=}")
+        # debug(f"Serial write {data=}")
         self.serial.write(data)
 
     # -------------------------------------------------------------------------
@@ -53,6 +53,9 @@ DEFAULT_FONT_SIZE = 14
 # All editor windows use the same font
 FONT_NAME = "Source Code Pro"
 
+# The platform does not change, so it is not determined for every key press
+ON_OSX = platform.system() == "Darwin"
+
 VT100_RETURN = b"\r"
 VT100_BACKSPACE = b"\b"
 VT100_DELETE = b"\x1B[\x33\x7E"
@@ -121,7 +124,7 @@ class MicroPythonREPLPane(QTextEdit):
         :returns: Nothing
         """
         menu = QMenu(self)
-        if platform.system() == "Darwin":
+        if ON_OSX:
             copy_keys = QKeySequence(Qt.CTRL + Qt.Key_C)
             paste_keys = QKeySequence(Qt.CTRL + Qt.Key_V)
         else:
@@ -151,13 +154,14 @@ class MicroPythonREPLPane(QTextEdit):
         """
         tc = self.textCursor()
         key = data.key()
-        ctrl_only = data.modifiers() == Qt.ControlModifier
-        meta_only = data.modifiers() == Qt.MetaModifier
+        modifiers = data.modifiers()
+        ctrl_only = modifiers == Qt.ControlModifier
+        meta_only = modifiers == Qt.MetaModifier
         ctrl_shift_only = (
-            data.modifiers() == Qt.ControlModifier | Qt.ShiftModifier
+            modifiers == Qt.ControlModifier | Qt.ShiftModifier
         )
-        shift_down = data.modifiers() & Qt.ShiftModifier
-        on_osx = platform.system() == "Darwin"
+        shift_down = modifiers & Qt.ShiftModifier
+        on_osx = ON_OSX
 
         # debug(f"{key=}")
         if key == Qt.Key_Return:
@@ -19,7 +19,6 @@ import time
 import argparse
 
 # 3rd party imports
-import keyboard
 from selenium.webdriver import Chrome
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.keys import Keys
@@ -172,6 +171,8 @@ def enter_password(browser, password: str, interval=0.5, max_retries=10) -> bool
     :returns: True in case of success, False in case of an error.
     """
 
+    import keyboard  # Only needed when typing in the browser, so not imported at startup
+
     element = browser.find_element_by_id("term")
 
     tries = 0
@@ -226,6 +227,7 @@ def wait_for_repl_prompt(browser, max_retries=10) -> bool:
         print("repl prompt found")
 
     # Just to be sure, exit raw repl mode
+    import keyboard
     keyboard.press_and_release('ctrl+b')
 
     return True
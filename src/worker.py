@@ -10,7 +10,7 @@ These functions make it possible to call an external executable and show the
 
 This module is based on https://stackoverflow.com/questions/60167832/run-command-with-pyqt5-and-getting-the-stdout-and-stderr
 As an enhancment, it will also show it's state, so when it is not desired that 2 threads run at the same time, one can
-wait till a thread is finished.
+wait till a thread is finished, with wait() or the finished signal.
 
 Usage example
 =============
@@ -36,11 +36,7 @@ Usage example
         def somefunction():
 
             param.worker.run_command("ping 127.0.0.1")
-            while param.worker.active:
-                # The following 3 lines will do the same as time.sleep(1), but more PyQt5 friendly.
-                loop = QEventLoop()
-                QTimer.singleShot(250, loop.quit)
-                loop.exec_()
+            param.worker.wait()     # Handles Qt events till the command has finished
             param.worker.run_command("ping 192.168.178.1")
 
         @pyqtSlot(str)
@@ -71,6 +67,7 @@ class Worker(QtCore.QObject):
     """QT Worker"""
 
     outSignal = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal()  # Emitted when the command has finished
     active = False
 
     # def __init__(self):
@@ -86,6 +83,22 @@ class Worker(QtCore.QObject):
             target=self._execute_command, args=(cmd,), kwargs=kwargs, daemon=True
         ).start()
 
+    # -------------------------------------------------------------------------
+    def wait(self):
+        """Wait till the command has finished, while handling Qt events.
+
+        A local event loop runs till the finished signal is received. The
+        signal is connected before 'active' is checked, so it can not be
+        missed when the command finishes in between.
+        """
+        loop = QtCore.QEventLoop()
+        self.finished.connect(loop.quit)
+        try:
+            if self.active:
+                loop.exec_()
+        finally:
+            self.finished.disconnect(loop.quit)
+
     # -------------------------------------------------------------------------
     def _execute_command(self, cmd, **kwargs):
         """Actually execute the command"""
@@ -95,6 +108,7 @@ class Worker(QtCore.QObject):
         for line in proc.stdout:
             self.outSignal.emit(line.decode())
         self.active = False
+        self.finished.emit()
 
 
 # =============================================================================
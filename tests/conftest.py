@@ -0,0 +1,10 @@
+"""pytest configuration.
+
+The modules are run from the src folder, and import each other as top level
+modules, so that folder is put on the path here.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -1,3 +1,258 @@
+"""Tests of the commandline shell.
+
+No device is needed: mpremote and the copy of the files are replaced by fakes.
+"""
+
+import os
+
+import pytest
+
+
 def test_do_hardreset():
     # assert False
     assert True
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def cli():
+    """The esp32cli module. The test is skipped when its dependencies are not installed."""
+
+    for name in ("cmd2", "colorama", "serial", "lib.helper"):
+        pytest.importorskip(name)
+    import esp32cli
+
+    return esp32cli
+
+
+@pytest.fixture
+def shell(cli, monkeypatch, tmp_path):
+    """ESPShell, running in an empty folder, connected to COM1."""
+
+    import param
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cli, "HISTORY_FILE", "")  # Do not save a history
+    monkeypatch.setattr(param, "port_str", "COM1")
+    cli._remote_cache.clear()
+    return cli.ESPShell(color=False, use_startup_script=False)
+
+
+@pytest.fixture
+def device(cli, monkeypatch):
+    """Replace mpremote.main() by a fake.
+
+    :returns: List with the mpremote command and arguments of every call
+    """
+
+    sent = []
+
+    def fake_main(args, persistent=False):
+        # args is ["connect", port, command, arguments...]
+        sent.append(args[2:])
+        if args[2] == "cp":
+            # Like mpremote, record the copied files
+            cli.mpremote_pyboard.last_copied.extend(args[3:-1])
+        return b"main.py\n"
+
+    monkeypatch.setattr(cli.mpremote, "main", fake_main)
+    return sent
+
+
+@pytest.fixture
+def clock(cli, monkeypatch):
+    """Replace time.monotonic() by a clock which is moved by hand."""
+
+    now = [1000.0]
+    monkeypatch.setattr(cli.time, "monotonic", lambda: now[0])
+    return now
+
+
+# -----------------------------------------------------------------------------
+def test_cached_output_is_reused(cli, shell, device, clock):
+    assert cli.run_remote_cached("ls") == b"main.py\n"
+    clock[0] += cli.REMOTE_CACHE_TTL / 2
+    assert cli.run_remote_cached("ls") == b"main.py\n"
+
+    assert device == [["ls"]]
+
+
+def test_cached_output_expires(cli, shell, device, clock):
+    cli.run_remote_cached("ls")
+    clock[0] += cli.REMOTE_CACHE_TTL
+    cli.run_remote_cached("ls")
+
+    assert device == [["ls"], ["ls"]]
+
+
+def test_cache_is_cleared_by_other_commands(cli, shell, device, clock):
+    cli.run_remote_cached("cat", "main.py")
+    cli.run_remote_cached("cat", "boot.py")
+    cli.run_remote("rm", "boot.py")
+    cli.run_remote_cached("cat", "main.py")
+
+    assert device == [["cat", "main.py"], ["cat", "boot.py"], ["rm", "boot.py"], ["cat", "main.py"]]
+
+
+# -----------------------------------------------------------------------------
+def test_onecmd_fast_splits_arguments(shell, monkeypatch):
+    statements = []
+    monkeypatch.setattr(shell, "do_dummy", statements.append, raising=False)
+
+    shell.onecmd_fast('dummy  a.py "b c.py" C:\\src\\d.py ')
+
+    statement = statements[0]
+    assert statement.command == "dummy"
+    assert statement.args == 'a.py "b c.py" C:\\src\\d.py'
+    # Quotes and backslashes are kept, like cmd2 does
+    assert statement.arg_list == ["a.py", '"b c.py"', "C:\\src\\d.py"]
+
+
+def test_onecmd_fast_passes_on_unknown_commands(shell, monkeypatch):
+    lines = []
+    monkeypatch.setattr(shell, "onecmd", lines.append)
+
+    shell.onecmd_fast("nosuchcommand x")
+
+    assert lines == ["nosuchcommand x"]
+
+
+def test_onecmd_fast_passes_on_redirection(shell, monkeypatch):
+    lines = []
+    monkeypatch.setattr(shell, "onecmd_plus_hooks", lines.append)
+
+    shell.onecmd_fast("ls > files.txt")
+    shell.onecmd_fast("ls | more")
+
+    assert lines == ["ls > files.txt", "ls | more"]
+
+
+# -----------------------------------------------------------------------------
+def test_put_many_returns_the_copied_files(cli, shell, device, tmp_path):
+    files = [str(tmp_path / "a.py"), str(tmp_path / "b.py")]
+
+    assert cli.put_many(files) == files
+    assert device[0][0] == "cp"
+    assert device[0][-1] == ":"
+    assert cli.put_many([]) == []
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def sourcefolder(cli, monkeypatch, tmp_path):
+    """Source folder with two python files."""
+
+    folder = tmp_path / "src"
+    folder.mkdir()
+    (folder / "a.py").write_text("print('a')\n")
+    (folder / "b.py").write_text("print('b')\n")
+    monkeypatch.setattr(cli.esp32common, "get_sourcefolder", lambda: folder)
+    return folder
+
+
+@pytest.fixture
+def copied(cli, monkeypatch):
+    """Replace put_many() by a fake, which copies all files.
+
+    :returns: List with the sorted names of the files of every call
+    """
+
+    calls = []
+
+    def fake_put_many(filenames):
+        calls.append(sorted(os.path.basename(f) for f in filenames))
+        return list(filenames)
+
+    monkeypatch.setattr(cli, "put_many", fake_put_many)
+    return calls
+
+
+def test_sync_skips_unchanged_files(shell, sourcefolder, copied):
+    shell.onecmd_fast("sync")
+    shell.onecmd_fast("sync")
+    (sourcefolder / "b.py").write_text("print('changed')\n")
+    shell.onecmd_fast("sync")
+
+    assert copied == [["a.py", "b.py"], [], ["b.py"]]
+
+
+def test_sync_force_copies_all_files(shell, sourcefolder, copied):
+    shell.onecmd_fast("sync")
+    shell.onecmd_fast("sync --force")
+
+    assert copied == [["a.py", "b.py"], ["a.py", "b.py"]]
+
+
+def test_sync_retries_files_which_were_not_copied(cli, shell, sourcefolder, monkeypatch):
+    calls = []
+
+    def fake_put_many(filenames):
+        calls.append(sorted(os.path.basename(f) for f in filenames))
+        return sorted(filenames)[:1]  # The copy of the second file fails
+
+    monkeypatch.setattr(cli, "put_many", fake_put_many)
+    shell.onecmd_fast("sync")
+    shell.onecmd_fast("sync")
+
+    assert calls == [["a.py", "b.py"], ["b.py"]]
+
+
+def test_sync_copies_files_again_after_rm(shell, sourcefolder, copied, device):
+    shell.onecmd_fast("sync")
+    shell.onecmd_fast("rm /b.py")
+    shell.onecmd_fast("sync")
+
+    assert copied == [["a.py", "b.py"], ["b.py"]]
+
+
+def test_sync_copies_all_files_again_after_cleanfs(shell, sourcefolder, copied, device):
+    shell.onecmd_fast("sync")
+    shell.onecmd_fast("cleanfs")
+    shell.onecmd_fast("sync")
+
+    assert copied == [["a.py", "b.py"], ["a.py", "b.py"]]
+
+
+def test_sync_manifest_is_not_in_the_sourcefolder(cli, shell, sourcefolder, copied, tmp_path):
+    shell.onecmd_fast("sync")
+
+    assert (tmp_path / cli.SYNC_MANIFEST).is_file()
+    assert sorted(os.listdir(sourcefolder)) == ["a.py", "b.py"]
+
+
+def test_sync_manifest_is_kept_per_sourcefolder(cli, shell, tmp_path):
+    cli.save_sync_manifest(tmp_path / "one", {"COM1": {"a.py": "1"}})
+    cli.save_sync_manifest(tmp_path / "two", {"COM1": {"a.py": "2"}})
+
+    assert cli.load_sync_manifest(tmp_path / "one") == {"COM1": {"a.py": "1"}}
+    assert cli.load_sync_manifest(tmp_path / "two") == {"COM1": {"a.py": "2"}}
+    assert cli.load_sync_manifest(tmp_path / "three") == {}
+
+
+# -----------------------------------------------------------------------------
+def test_import_remote_runs_the_module_again(cli, shell, device):
+    cli.import_remote("blink.py")
+    cli.import_remote("blink.py")
+
+    # Every import removes the module first, so the device runs it again
+    assert len(device) == 2
+    for command in device:
+        assert command[0] == "exec"
+        assert command[1].index("sys.modules.pop('blink', None)") < command[1].index("import blink")
+
+
+# -----------------------------------------------------------------------------
+def test_transfer_buffer_size_out_of_range_is_rejected(cli, shell, monkeypatch):
+    import param
+
+    monkeypatch.setattr(param, "transfer_buffer_size", 4096)
+    monkeypatch.setattr(cli.mpremote_pyboard, "transfer_chunk_size", 4096)
+
+    shell.onecmd_fast("set transfer_buffer_size 100000000")
+    shell.onecmd_fast("set transfer_buffer_size 0")
+    assert param.transfer_buffer_size == 4096
+    assert cli.mpremote_pyboard.transfer_chunk_size == 4096
+
+    shell.onecmd_fast("set transfer_buffer_size 1024")
+    assert param.transfer_buffer_size == 1024
+    assert cli.mpremote_pyboard.transfer_chunk_size == 1024
@@ -0,0 +1,211 @@
+"""Tests of the changes to the local copy of mpremote.
+
+No device is needed: the serial port and the connection are replaced by fakes.
+"""
+
+import pytest
+
+serial = pytest.importorskip("serial")
+
+from local_mpremote import main as mpremote  # noqa: E402
+from local_mpremote import pyboard  # noqa: E402
+
+
+# -----------------------------------------------------------------------------
+class FakeSerial:
+    """Serial port, which returns the bytes it was given, and records the reads."""
+
+    def __init__(self, data=b""):
+        self.pending = bytearray(data)
+        self.written = bytearray()
+        self.reads = []
+        self.timeout = 1
+        self.is_open = True
+        self.unplugged = False
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise serial.SerialException("Port is not open")
+        return len(self.pending)
+
+    def inWaiting(self):
+        return self.in_waiting
+
+    def read(self, size=1):
+        self.reads.append(size)
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        return data
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+    def open(self):
+        if self.unplugged:
+            raise serial.SerialException("Port not found")
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+
+# -----------------------------------------------------------------------------
+class FakePyboard:
+    """Connection to a device, which only keeps track of its state."""
+
+    def __init__(self, dev):
+        self.device_name = dev
+        self.serial = pyboard.BufferedSerial(FakeSerial())
+        self.in_raw_repl = False
+        self.mounted = False
+        self.closed = False
+
+    def enter_raw_repl(self, soft_reset=True):
+        self.in_raw_repl = True
+
+    def exit_raw_repl(self):
+        self.in_raw_repl = False
+
+    def reopen(self):
+        self.in_raw_repl = False
+        self.serial.open()
+
+    def close(self):
+        self.closed = True
+        self.serial.close()
+
+
+# -----------------------------------------------------------------------------
+def test_read_fetches_all_waiting_bytes():
+    port = FakeSerial(b"abcdef")
+    buffered = pyboard.BufferedSerial(port)
+
+    assert buffered.read(1) == b"a"
+    assert port.reads == [6]
+    assert buffered.inWaiting() == 5
+
+    # The rest comes from the buffer, without asking the driver
+    assert buffered.read(2) == b"bc"
+    assert buffered.read(3) == b"def"
+    assert port.reads == [6]
+
+
+def test_read_asks_for_the_missing_bytes():
+    port = FakeSerial(b"ab")
+    buffered = pyboard.BufferedSerial(port)
+
+    assert buffered.read(4) == b"ab"
+    assert port.reads == [4]
+
+
+def test_inwaiting_asks_driver_when_buffer_is_empty():
+    port = FakeSerial(b"xyz")
+    buffered = pyboard.BufferedSerial(port)
+
+    assert buffered.inWaiting() == 3
+    assert port.reads == []
+
+
+def test_write_timeout_and_close_are_passed_on():
+    port = FakeSerial(b"abc")
+    buffered = pyboard.BufferedSerial(port)
+
+    buffered.write(b"\x04")
+    assert port.written == b"\x04"
+
+    buffered.timeout = 5
+    assert port.timeout == 5
+    assert buffered.is_open
+
+    buffered.read(1)
+    buffered.close()
+    assert not port.is_open
+    assert buffered.buf == b""
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def connections(monkeypatch, tmp_path):
+    """Replace the device connection by a FakePyboard.
+
+    :returns: List with the FakePyboard of every connection which was made
+    """
+
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))  # No mpremote user config
+    monkeypatch.setattr(mpremote, "_connections", {})
+    monkeypatch.setattr(mpremote, "execbuffer", lambda pyb, buf, follow: 0)
+
+    made = []
+
+    def fake_connect(args):
+        pyb = FakePyboard(args.pop(0))
+        made.append(pyb)
+        return pyb
+
+    monkeypatch.setattr(mpremote, "do_connect", fake_connect)
+    return made
+
+
+def run(*args):
+    return mpremote.main(["connect", "COM1", *args], persistent=True)
+
+
+def test_connection_is_reused(connections):
+    run("exec", "pass")
+    run("exec", "pass")
+
+    assert len(connections) == 1
+    assert mpremote._connections == {"COM1": connections[0]}
+    assert not connections[0].closed
+    assert connections[0].in_raw_repl
+
+
+def test_connection_is_dropped_after_failed_exec(connections, monkeypatch):
+    monkeypatch.setattr(mpremote, "execbuffer", lambda pyb, buf, follow: 1)
+    run("exec", "1/0")
+
+    assert "COM1" not in mpremote._connections
+    assert connections[0].closed
+
+    monkeypatch.setattr(mpremote, "execbuffer", lambda pyb, buf, follow: 0)
+    run("exec", "pass")
+    assert len(connections) == 2
+
+
+def test_connection_is_dropped_after_exception(connections, monkeypatch):
+    def fail(pyb, buf, follow):
+        raise pyboard.PyboardError("could not enter raw repl")
+
+    monkeypatch.setattr(mpremote, "execbuffer", fail)
+    with pytest.raises(pyboard.PyboardError):
+        run("exec", "pass")
+
+    assert "COM1" not in mpremote._connections
+    assert connections[0].closed
+
+
+def test_released_connection_is_reopened(connections):
+    run("exec", "pass")
+    mpremote.release_connection()
+
+    port = connections[0].serial.orig_serial
+    assert not port.is_open
+    assert not connections[0].in_raw_repl
+
+    run("exec", "pass")
+    assert len(connections) == 1
+    assert port.is_open
+
+
+def test_unplugged_connection_is_replaced(connections):
+    run("exec", "pass")
+    port = connections[0].serial.orig_serial
+    port.is_open = False
+    port.unplugged = True
+
+    run("exec", "pass")
+    assert len(connections) == 2
+    assert connections[0].closed
+    assert mpremote._connections == {"COM1": connections[1]}